@@ -1,15 +1,27 @@
 # 📢 نظام إدارة الإعلانات المتقدم
 # ================================
 
+import os
 import json
+import heapq
 import random
 from datetime import datetime, date
-from config import ADS_LIST, MAX_ADS_PER_USER_DAILY, STATS_FILE
+from config import STATS_FILE
+from profiler import profiler
+from settings import settings
 
 # ملف المستخدمين
 USERS_FILE = "users.json"
 
 
+def write_json(path: str, data):
+    """كتابة ذرية: الملف القديم يبقى سليماً إذا توقف البوت أثناء الكتابة"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
 class AdsManager:
     def __init__(self):
         self.stats = self.load_stats()
@@ -34,8 +46,7 @@ class AdsManager:
     def save_stats(self):
         """حفظ الإحصائيات"""
         try:
-            with open(STATS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.stats, f, indent=2, ensure_ascii=False)
+            write_json(STATS_FILE, self.stats)
         except Exception as e:
             print(f"Error saving stats: {e}")
     
@@ -50,11 +61,15 @@ class AdsManager:
     def save_users(self):
         """حفظ بيانات المستخدمين"""
         try:
-            with open(USERS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.users, f, indent=2, ensure_ascii=False)
+            write_json(USERS_FILE, self.users)
         except Exception as e:
             print(f"Error saving users: {e}")
     
+    def flush(self):
+        """حفظ كل الحالة (عند إيقاف البوت)"""
+        self.save_stats()
+        self.save_users()
+    
     def register_user(self, user_id: int, first_name: str = None, username: str = None):
         """تسجيل مستخدم جديد"""
         user_id = str(user_id)
@@ -71,12 +86,36 @@ class AdsManager:
             self.save_users()
         else:
             self.users[user_id]["last_use"] = today
+            # المستخدم عاد بعد حظر البوت
+            self.users[user_id].pop("active", None)
             if first_name:
                 self.users[user_id]["first_name"] = first_name
             if username:
                 self.users[user_id]["username"] = username
             self.save_users()
     
+    def mark_inactive(self, user_id: int):
+        """تعليم مستخدم حظر البوت (يُستثنى من الرسائل الجماعية)"""
+        user_id = str(user_id)
+        if user_id in self.users:
+            self.users[user_id]["active"] = False
+    
+    def get_active_user_ids(self, after: int = None, limit: int = None) -> list:
+        """
+        معرفات المستخدمين النشطين بترتيب ثابت
+        after/limit: صفحة واحدة فقط (المعرفات بعد after) بدل القائمة كاملة
+        """
+        ids = (int(uid) for uid, data in self.users.items() if data.get("active", True))
+        if after is not None:
+            ids = (uid for uid in ids if uid > after)
+        if limit is not None:
+            return heapq.nsmallest(limit, ids)
+        return sorted(ids)
+    
+    def count_active_users(self) -> int:
+        """عدد المستخدمين النشطين"""
+        return sum(1 for data in self.users.values() if data.get("active", True))
+    
     def get_user_stats(self, user_id: int) -> dict:
         """الحصول على إحصائيات المستخدم"""
         user_id = str(user_id)
@@ -111,7 +150,7 @@ class AdsManager:
     
     def get_active_ads(self):
         """جلب الإعلانات النشطة"""
-        return [ad for ad in ADS_LIST if ad.get("active", True)]
+        return list(settings.current.active_ads)
     
     def get_next_ad(self, user_id: int):
         """جلب الإعلان التالي (كلاسيكي)"""
@@ -124,7 +163,7 @@ class AdsManager:
         if self.user_ad_count[user_id]["date"] != today:
             self.user_ad_count[user_id] = {"date": today, "count": 0}
         
-        if self.user_ad_count[user_id]["count"] >= MAX_ADS_PER_USER_DAILY:
+        if self.user_ad_count[user_id]["count"] >= settings.current.max_ads_per_user_daily:
             return None
         
         active_ads = self.get_active_ads()
@@ -156,35 +195,28 @@ class AdsManager:
         if self.user_ad_count[user_id]["date"] != today:
             self.user_ad_count[user_id] = {"date": today, "count": 0}
         
-        if self.user_ad_count[user_id]["count"] >= MAX_ADS_PER_USER_DAILY:
+        # لقطة واحدة للطلب كله (قد تُستبدل أثناء التنفيذ عند تعديل الملف)
+        current = settings.current
+        if self.user_ad_count[user_id]["count"] >= current.max_ads_per_user_daily:
             return None
         
-        active_ads = self.get_active_ads()
-        if not active_ads:
+        if not current.active_ads:
             return None
         
-        # ترتيب حسب الأولوية
-        sorted_ads = sorted(active_ads, key=lambda x: x.get("priority", 999))
-        
-        # اختيار إعلان مختلف
-        last_index = self.last_ad_index.get(user_id, -1)
-        
-        # 70% اختيار حسب الأولوية، 30% عشوائي
-        if random.random() < 0.7 and len(sorted_ads) > 0:
-            # اختيار من أعلى الأولويات
-            top_ads = sorted_ads[:min(2, len(sorted_ads))]
-            ad = random.choice(top_ads)
+        # 70% اختيار من أعلى الأولويات (مرتبة مسبقاً)، 30% عشوائي
+        if random.random() < 0.7:
+            ad = random.choice(current.top_ads)
         else:
-            # اختيار عشوائي
-            ad = random.choice(active_ads)
+            ad = random.choice(current.active_ads)
         
         # تحديث العدادات
-        ad_index = active_ads.index(ad) if ad in active_ads else 0
+        ad_index = current.ad_positions.get(ad["id"], 0)
         self.last_ad_index[user_id] = ad_index
         self.user_ad_count[user_id]["count"] += 1
         
         return ad
     
+    @profiler.traced("record_ad_shown")
     def record_ad_shown(self, user_id: int, ad_id: str):
         """تسجيل عرض الإعلان"""
         today = str(date.today())
@@ -207,6 +239,7 @@ class AdsManager:
         
         self.save_stats()
     
+    @profiler.traced("record_download")
     def record_download(self, user_id: int):
         """تسجيل عملية تحميل"""
         today = str(date.today())
@@ -239,6 +272,7 @@ class AdsManager:
         
         self.save_stats()
     
+    @profiler.traced("record_click")
     def record_click(self, ad_id: str):
         """تسجيل نقرة على الإعلان"""
         today = str(date.today())
@@ -279,6 +313,22 @@ class AdsManager:
         
         return report
     
+    def get_admin_summary(self) -> dict:
+        """ملخص أرقام لوحة المشرف"""
+        today = str(date.today())
+        total_shown = self.stats["total_ads_shown"]
+        total_clicks = sum(ad.get("clicks", 0) for ad in self.stats["ad_clicks"].values())
+        ctr = (total_clicks / total_shown * 100) if total_shown > 0 else 0
+        
+        return {
+            "total_users": len(self.users),
+            "total_downloads": self.stats["total_downloads"],
+            "active_today": sum(1 for u in self.users.values() if u.get("last_use") == today),
+            "ad_views": total_shown,
+            "ad_clicks": total_clicks,
+            "ctr": round(ctr, 1)
+        }
+    
     def get_admin_report(self):
         """تقرير المشرف المتقدم"""
         today = str(date.today())
@@ -324,6 +374,3 @@ class AdsManager:
         
         return report
 
-
-# إنشاء instance
-ads_manager = AdsManager()
@@ -0,0 +1,109 @@
+# ⏱️ قياس سرعة تحميل HLS مع أجزاء متوازية
+# ================================
+# يشغّل خادم HTTP محلي يقدّم قائمة HLS اصطناعية مع تأخير لكل جزء،
+# ثم يقارن زمن التحميل بين عدد مختلف من الأجزاء المتوازية.
+#
+# الاستخدام:
+#     python benchmarks/bench_hls.py --segments 60 --latency 0.08
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from downloader import VideoDownloader
+
+
+def make_playlist(root: str, segments: int, segment_kb: int):
+    """إنشاء قائمة HLS مع أجزاء عشوائية"""
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-TARGETDURATION:2",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    for i in range(segments):
+        name = f"seg{i:04d}.ts"
+        with open(os.path.join(root, name), "wb") as f:
+            f.write(os.urandom(segment_kb * 1024))
+        lines.append("#EXTINF:2.0,")
+        lines.append(name)
+    lines.append("#EXT-X-ENDLIST")
+    with open(os.path.join(root, "playlist.m3u8"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def serve(root: str, latency: float):
+    """خادم محلي يضيف تأخيراً ثابتاً لكل طلب (يحاكي CDN بعيد)"""
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=root, **kwargs)
+
+        def do_GET(self):
+            time.sleep(latency)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_once(downloader: VideoDownloader, url: str, out_dir: str, fragments: int) -> float:
+    """تحميل القائمة مرة واحدة وإرجاع المدة"""
+    opts = downloader._build_opts(url, os.path.join(out_dir, f"bench_{fragments}.%(ext)s"))
+    opts['concurrent_fragment_downloads'] = fragments
+    opts['format'] = 'best'
+    opts['fixup'] = 'never'
+    opts['noprogress'] = True
+    opts.pop('external_downloader', None)
+
+    start = time.perf_counter()
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        ydl.download([url])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HLS concurrent fragment benchmark")
+    parser.add_argument("--segments", type=int, default=60)
+    parser.add_argument("--segment-kb", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=0.08, help="ثواني تأخير لكل طلب")
+    parser.add_argument("--fragments", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="hls_src_")
+    out_dir = tempfile.mkdtemp(prefix="hls_out_")
+    try:
+        make_playlist(root, args.segments, args.segment_kb)
+        server = serve(root, args.latency)
+        url = f"http://127.0.0.1:{server.server_address[1]}/playlist.m3u8"
+
+        total_mb = args.segments * args.segment_kb / 1024
+        print(f"{args.segments} segments, {total_mb:.1f} MB, {args.latency * 1000:.0f} ms latency")
+        print("-" * 50)
+
+        downloader = VideoDownloader()
+        baseline = None
+        for n in args.fragments:
+            elapsed = run_once(downloader, url, out_dir, n)
+            baseline = baseline or elapsed
+            print(f"fragments={n:<3} {elapsed:6.2f}s  {total_mb / elapsed:6.1f} MB/s  x{baseline / elapsed:.1f}")
+
+        server.shutdown()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# 🚀 قياس زمن بدء البوت حتى أول polling
+# ================================
+# يشغّل bot.py الحقيقي في process منفصل مع Bot API وهمي، ويقيس:
+#   - زمن استيراد bot.py
+#   - الزمن من تشغيل الـ process حتى أول طلب getUpdates
+#   - استهلاك الذاكرة (RSS) لحظة أول polling
+#   - هل تم استيراد yt-dlp عند استيراد bot.py
+#
+# الاستخدام:
+#     python benchmarks/bench_startup.py --runs 5
+
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from statistics import median
+
+from load_test import REPO_ROOT, FakeBotAPI, start_bot_api
+
+CHILD = r"""
+import sys, time, json
+sys.path.insert(0, sys.argv[1])
+started = time.perf_counter()
+import bot
+import_seconds = time.perf_counter() - started
+print(json.dumps({"import_seconds": import_seconds, "yt_dlp_at_import": "yt_dlp" in sys.modules}), flush=True)
+
+from telegram.ext import Application
+builder = Application.builder().base_url(sys.argv[2] + "/bot").base_file_url(sys.argv[2] + "/file/bot")
+bot.build_application(builder).run_polling(drop_pending_updates=True)
+"""
+
+
+class StartupAPI(FakeBotAPI):
+    """يسجل لحظة أول getUpdates"""
+
+    def __init__(self):
+        super().__init__(chat_rate=1000, chat_burst=1000, global_rate=1000, upload_bps=0)
+        self.first_poll = threading.Event()
+        self.first_poll_at = None
+
+    def handle(self, method, params, body_size, multipart):
+        if method == "getUpdates" and not self.first_poll.is_set():
+            self.first_poll_at = time.perf_counter()
+            self.first_poll.set()
+        if method == "getUpdates":
+            # محاكاة long polling حتى لا يدور البوت في حلقة سريعة
+            time.sleep(0.5)
+        return super().handle(method, params, body_size, multipart)
+
+
+def read_rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def run_once(timeout: float) -> dict:
+    api = StartupAPI()
+    server = start_bot_api(api)
+    # البوت يُغلق أثناء long polling: تجاهل أخطاء broken pipe
+    server.handle_error = lambda request, address: None
+    api_base = f"http://127.0.0.1:{server.server_address[1]}"
+    workdir = tempfile.mkdtemp(prefix="bot_startup_")
+
+    started = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, "-c", CHILD, REPO_ROOT, api_base],
+        cwd=workdir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        info = json.loads(child.stdout.readline() or "{}")
+        if not api.first_poll.wait(timeout):
+            raise RuntimeError("bot did not poll in time")
+        info["first_poll_seconds"] = api.first_poll_at - started
+        info["rss_mb"] = read_rss_mb(child.pid)
+    finally:
+        child.send_signal(signal.SIGINT)
+        try:
+            child.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            child.kill()
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    results = [run_once(args.timeout) for _ in range(args.runs)]
+
+    print(f"{'run':<6}{'import s':>10}{'first poll s':>14}{'RSS MB':>10}  yt-dlp loaded")
+    for i, r in enumerate(results, 1):
+        print(f"{i:<6}{r['import_seconds']:>10.3f}{r['first_poll_seconds']:>14.3f}{r['rss_mb']:>10.1f}  {r['yt_dlp_at_import']}")
+    print("-" * 56)
+    print(f"{'median':<6}"
+          f"{median(r['import_seconds'] for r in results):>10.3f}"
+          f"{median(r['first_poll_seconds'] for r in results):>14.3f}"
+          f"{median(r['rss_mb'] for r in results):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+# 🧪 اختبار الحمل بدون إنترنت (yt-dlp وهمي + Telegram وهمي)
+# ================================
+# يشغّل handlers الحقيقية في bot.py و AdsManager مع:
+#   - yt-dlp وهمي: تأخير استخراج، نسبة فشل، وتحميل ملفات من خادم HTTP محلي
+#   - Bot API وهمي: خادم محلي يسجل الطلبات ويحاكي حدود Telegram (429)
+# ثم يرسل روابط من N مستخدمين ويطبع الإنتاجية ونسب p50/p95/p99 لكل مرحلة
+# واستهلاك الذاكرة وعدد الـ file descriptors.
+#
+# الاستخدام:
+#     python benchmarks/load_test.py --users 20 --links 5 --file-mb 2
+#
+# منافسة على أماكن التحميل (مستخدم كثيف + فيديوهات قصيرة وطويلة):
+#     python benchmarks/load_test.py --users 20 --links 3 --heavy-users 1 --heavy-links 30 \
+#         --durations 30,600 --seconds-per-minute 0.5 --slots 2
+
+import os
+import sys
+import json
+import time
+import email
+import random
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+from types import SimpleNamespace
+from collections import defaultdict
+from urllib.parse import parse_qs
+from urllib.request import urlopen
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# ============== Media server ==============
+
+def start_media_server(size_bytes: int):
+    """خادم يقدّم نفس الملف لأي مسار (يحاكي CDN)"""
+    payload = os.urandom(size_bytes)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ============== Fake yt-dlp ==============
+
+class FakeDownloadError(Exception):
+    pass
+
+
+def make_fake_yt_dlp(media_url: str, extract_latency: float, failure_rate: float,
+                     durations: list = (30,), seconds_per_minute: float = 0.0):
+    """
+    وحدة تحاكي واجهة yt_dlp التي يستخدمها downloader.py
+    durations: مدد الفيديوهات الممكنة (ثابتة لكل video_id)
+    seconds_per_minute: زمن التحميل لكل دقيقة من الفيديو (لمحاكاة الطابور)
+    """
+
+    class FakeYoutubeDL:
+        def __init__(self, params=None):
+            self.params = params or {}
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def prepare_filename(self, info: dict) -> str:
+            return self.params.get('outtmpl', '%(id)s.%(ext)s') % defaultdict(str, info)
+
+        def _hook(self, status: dict):
+            for hook in self.params.get('progress_hooks', []):
+                hook(status)
+
+        def extract_info(self, url: str, download: bool = True, process: bool = True):
+            time.sleep(extract_latency)
+            video_id = url.rsplit('=', 1)[-1]
+            if random.random() < failure_rate:
+                raise FakeDownloadError("ERROR: [fake] Video unavailable")
+
+            info = {
+                "id": video_id,
+                "title": f"Synthetic video {video_id}",
+                "ext": "mp4",
+                "duration": random.Random(video_id).choice(durations),
+                "extractor": "fake",
+                "uploader": "bench",
+            }
+            if not download:
+                return info
+            return self.process_ie_result(info, download=True)
+
+        def process_ie_result(self, info: dict, download: bool = True):
+            path = self.prepare_filename(info)
+            started = time.perf_counter()
+            downloaded = 0
+            with urlopen(media_url) as response, open(path, 'wb') as f:
+                total = int(response.headers.get("Content-Length", 0))
+                while True:
+                    chunk = response.read(256 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    elapsed = time.perf_counter() - started
+                    self._hook({
+                        "status": "downloading",
+                        "downloaded_bytes": downloaded,
+                        "total_bytes": total,
+                        "speed": downloaded / elapsed if elapsed else None,
+                    })
+            remaining = info["duration"] / 60 * seconds_per_minute - (time.perf_counter() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+            self._hook({"status": "finished", "downloaded_bytes": downloaded, "total_bytes": downloaded})
+            info["requested_downloads"] = [{"filepath": path}]
+            return info
+
+    return SimpleNamespace(
+        YoutubeDL=FakeYoutubeDL,
+        utils=SimpleNamespace(DownloadError=FakeDownloadError),
+    )
+
+
+# ============== Fake Bot API ==============
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """0 إذا كان مسموحاً، وإلا عدد ثواني الانتظار"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class FakeBotAPI:
+    """يسجل الطلبات ويرد بنتائج Bot API مقبولة لـ python-telegram-bot"""
+
+    def __init__(self, chat_rate: float, chat_burst: float, global_rate: float, upload_bps: float):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets = {}
+        self.upload_bps = upload_bps
+        self.calls = defaultdict(int)
+        self.rate_limited = defaultdict(int)
+        self.uploaded_bytes = 0
+        self.lock = threading.Lock()
+        self.next_message_id = 1
+
+    def _message(self, chat_id, **extra) -> dict:
+        with self.lock:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id or 0), "type": "private"},
+            **extra,
+        }
+
+    def _media(self, kind: str) -> dict:
+        file_id = f"{kind}_{random.getrandbits(48):x}"
+        media = {"file_id": file_id, "file_unique_id": file_id[-12:], "duration": 30}
+        if kind == "video":
+            media.update(width=640, height=360)
+        return media
+
+    def _rate_limit(self, method: str, chat_id):
+        """محاكاة حدود Telegram للرسائل"""
+        if not (method.startswith("send") or method.startswith("edit")) or method == "sendChatAction":
+            return 0.0
+        with self.lock:
+            wait = self.global_bucket.take()
+            if not wait and chat_id is not None:
+                bucket = self.chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+                wait = bucket.take()
+        return wait
+
+    def handle(self, method: str, params: dict, body_size: int, multipart: bool):
+        with self.lock:
+            self.calls[method] += 1
+
+        chat_id = params.get("chat_id")
+        wait = self._rate_limit(method, chat_id)
+        if wait:
+            with self.lock:
+                self.rate_limited[method] += 1
+            retry_after = max(1, int(wait + 0.999))
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }
+
+        if multipart:
+            with self.lock:
+                self.uploaded_bytes += body_size
+            if self.upload_bps:
+                time.sleep(body_size / self.upload_bps)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+                      "can_join_groups": False, "can_read_all_group_messages": False,
+                      "supports_inline_queries": True}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(chat_id, text=params.get("text", ""))
+        elif method == "sendVideo":
+            result = self._message(chat_id, video=self._media("video"))
+        elif method == "sendAudio":
+            result = self._message(chat_id, audio=self._media("audio"))
+        elif method == "getUpdates":
+            result = []
+        elif method == "sendMediaGroup":
+            items = json.loads(params.get("media", "[]"))
+            result = [self._message(chat_id, video=self._media("video")) for _ in items]
+        else:
+            result = True
+        return 200, {"ok": True, "result": result}
+
+
+def parse_params(content_type: str, body: bytes) -> tuple:
+    """قراءة البارامترات من form-urlencoded أو multipart"""
+    if content_type.startswith("multipart/form-data"):
+        message = email.message_from_bytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body, policy=HTTP
+        )
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name and not part.get_filename():
+                params[name] = part.get_content().strip() if part.get_content_maintype() == "text" else part.get_payload(decode=True).decode()
+        return params, True
+    if content_type.startswith("application/json"):
+        return (json.loads(body or b"{}"), False)
+    return ({k: v[0] for k, v in parse_qs(body.decode()).items()}, False)
+
+
+def start_bot_api(api: FakeBotAPI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            method = self.path.rstrip("/").rsplit("/", 1)[-1]
+            params, multipart = parse_params(self.headers.get("Content-Type", ""), body)
+            status, payload = api.handle(method, params, length, multipart)
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ============== Load generator ==============
+
+def count_fds() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+async def sample_resources(samples: dict, stop: asyncio.Event):
+    while not stop.is_set():
+        samples["fds"].append(count_fds())
+        samples["rss_kb"].append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.1)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args):
+    media_server = start_media_server(int(args.file_mb * 1024 * 1024))
+    media_url = f"http://127.0.0.1:{media_server.server_address[1]}/media.mp4"
+
+    api = FakeBotAPI(args.chat_rate, args.chat_burst, args.global_rate, args.upload_mbps * 1_000_000 / 8)
+    api_server = start_bot_api(api)
+    api_base = f"http://127.0.0.1:{api_server.server_address[1]}"
+
+    # الاستيراد بعد تغيير المجلد حتى تُكتب ملفات JSON في المجلد المؤقت
+    import logging
+    import bot
+    import downloader as downloader_module
+    from metrics import STAGE_SECONDS
+    from request_log import analyze
+    from telegram import Update
+    from telegram.ext import Application
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    downloader_module.yt_dlp = make_fake_yt_dlp(
+        media_url, args.extract_latency, args.failure_rate,
+        [int(d) for d in args.durations.split(",")], args.seconds_per_minute
+    )
+    downloader_module.YT_DLP_AVAILABLE = True
+    bot.settings.update({"rate_limit_seconds": 0})
+    if args.slots:
+        bot.downloader.scheduler.slots = args.slots
+    if args.profile is not None:
+        bot.profiler.set_enabled(True, args.profile)
+
+    # نسخ القيم الخام لحساب النسب المئوية بدقة
+    stage_samples = defaultdict(list)
+    observe = STAGE_SECONDS.observe
+
+    def recording_observe(value, *labels):
+        stage_samples[labels[0] if labels else ""].append(value)
+        observe(value, *labels)
+
+    STAGE_SECONDS.observe = recording_observe
+
+    # نفس إعداد البوت الحقيقي (handlers + جدولة الرسائل)
+    app = bot.build_application(
+        Application.builder()
+        .base_url(f"{api_base}/bot")
+        .base_file_url(f"{api_base}/file/bot")
+        .connection_pool_size(max(16, args.users * 2))
+        .pool_timeout(30)
+        .write_timeout(60)
+    )
+
+    errors = defaultdict(int)
+
+    async def count_errors(update, context):
+        errors[type(context.error).__name__] += 1
+
+    app.add_error_handler(count_errors)
+    await app.initialize()
+    bot.request_logger.start()
+
+    known_ids = []
+    update_ids = iter(range(1, 10 ** 9))
+    end_to_end = []
+    heavy_ids = {1000 + i for i in range(args.heavy_users)}
+    user_latency = defaultdict(list)
+
+    async def send_link(user_id: int, kind: str):
+        if known_ids and random.random() < args.repeat_ratio:
+            video_id = random.choice(known_ids)
+        else:
+            video_id = f"bench{random.getrandbits(40):x}"
+            known_ids.append(video_id)
+        url = f"https://www.youtube.com/watch?v={video_id}"
+        update_id = next(update_ids)
+        data = {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "text": url,
+                "entities": [{"type": "url", "offset": 0, "length": len(url)}],
+            },
+        }
+        started = time.perf_counter()
+        await app.process_update(Update.de_json(data, app.bot))
+        end_to_end.append(time.perf_counter() - started)
+        user_latency[kind].append(end_to_end[-1])
+
+    async def user_session(user_id: int):
+        if user_id in heavy_ids:
+            # كل الروابط دفعة واحدة (كأنها لُصقت بسرعة)
+            await asyncio.gather(*(send_link(user_id, "heavy") for _ in range(args.heavy_links)))
+            return
+        for _ in range(args.links):
+            await send_link(user_id, "light")
+            if args.think_time:
+                await asyncio.sleep(random.uniform(0, args.think_time))
+
+    resources = defaultdict(list)
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_resources(resources, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(1000 + i) for i in range(args.users + args.heavy_users)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await sampler
+    await app.shutdown()
+    await bot.request_logger.stop()
+    api_server.shutdown()
+    media_server.shutdown()
+
+    total = args.users * args.links + args.heavy_users * args.heavy_links
+    print(f"\n{args.users} users x {args.links} links + {args.heavy_users} heavy x {args.heavy_links} = {total} requests in {elapsed:.2f}s")
+    print(f"Throughput: {total / elapsed:.2f} req/s")
+    print("-" * 64)
+    print(f"{'stage':<14}{'count':>7}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    rows = list(stage_samples.items()) + [("end_to_end", end_to_end)]
+    if args.heavy_users:
+        rows += [(f"e2e_{kind}", samples) for kind, samples in sorted(user_latency.items())]
+    for stage, samples in rows:
+        print(f"{stage:<14}{len(samples):>7}"
+              f"{percentile(samples, 50) * 1000:>12.1f}"
+              f"{percentile(samples, 95) * 1000:>12.1f}"
+              f"{percentile(samples, 99) * 1000:>12.1f}")
+    print("-" * 64)
+    print(f"Bot API calls: {dict(api.calls)}")
+    print(f"Rate limited (429): {dict(api.rate_limited) or 0}")
+    print(f"Unhandled errors: {dict(errors) or 0}")
+    print(f"Uploaded: {api.uploaded_bytes / (1024 * 1024):.1f} MB")
+    print(f"Peak RSS: {max(resources['rss_kb'] or [0]) / 1024:.1f} MB")
+    print(f"Open fds: max {max(resources['fds'] or [0])}, end {count_fds()}")
+    if args.profile is not None:
+        status = bot.profiler.status()
+        print(f"Profiled: {status['requests']} requests, {status['kept']} slow profiles kept")
+
+    print("\n" + "=" * 64)
+    print("Request log summary")
+    analyze([bot.request_logger.path])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the bot")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--links", type=int, default=5, help="روابط لكل مستخدم")
+    parser.add_argument("--file-mb", type=float, default=2.0)
+    parser.add_argument("--extract-latency", type=float, default=0.3, help="ثواني extract_info الوهمي")
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--repeat-ratio", type=float, default=0.2, help="نسبة الروابط المكررة (كاش)")
+    parser.add_argument("--think-time", type=float, default=0.5, help="أقصى انتظار بين روابط المستخدم")
+    parser.add_argument("--upload-mbps", type=float, default=200, help="0 = بدون محاكاة سرعة الرفع")
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="رسائل/ثانية لكل محادثة")
+    parser.add_argument("--chat-burst", type=float, default=5.0, help="رسائل متتالية مسموحة لكل محادثة")
+    parser.add_argument("--global-rate", type=float, default=30.0, help="رسائل/ثانية للبوت كله")
+    parser.add_argument("--profile", type=float, default=None, help="تفعيل profiling بهذا الحد (ثواني)")
+    parser.add_argument("--heavy-users", type=int, default=0, help="مستخدمون يرسلون روابط بدون توقف")
+    parser.add_argument("--heavy-links", type=int, default=20, help="روابط لكل مستخدم كثيف")
+    parser.add_argument("--durations", default="30", help="مدد الفيديوهات بالثواني، مثلاً 30,600")
+    parser.add_argument("--seconds-per-minute", type=float, default=0.0, help="زمن التحميل الوهمي لكل دقيقة فيديو")
+    parser.add_argument("--slots", type=int, default=None, help="تغيير DOWNLOAD_SLOTS")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bot_load_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
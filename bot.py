@@ -5,25 +5,45 @@ Professional bot with ads system
 """
 
 import os
+import time
+import signal
 import asyncio
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaVideo,
+    InlineQueryResultCachedVideo, InlineQueryResultCachedAudio, InlineQueryResultsButton
+)
+from telegram.error import TelegramError, BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
     filters,
     ContextTypes
 )
 
 from config import (
-    BOT_TOKEN, ADS_ENABLED, ADMIN_IDS, 
-    SUPPORTED_PLATFORMS, FORCE_CHANNEL, FORCE_CHANNEL_USERNAME
+    BOT_TOKEN, ADMIN_IDS, FORCE_CHANNEL, FORCE_CHANNEL_USERNAME,
+    BATCH_MAX_LINKS, PLAYLIST_MAX_ITEMS, SETTINGS_POLL_SECONDS, SHUTDOWN_DRAIN_SECONDS,
+    MAX_PARALLEL_DOWNLOADS_PER_USER, METRICS_ENABLED, METRICS_HOST, METRICS_PORT,
+    WARMUP_DELAY_SECONDS, TIER_WEIGHTS, MAX_CONCURRENT_UPDATES,
+    PREVIEW_FIRST_ENABLED, PREVIEW_TTL_SECONDS, PREVIEW_MAX_PENDING, CACHE_SAVE_INTERVAL_SECONDS
 )
 from ads_manager import AdsManager
 from downloader import VideoDownloader
+from splitter import VideoSplitter
+from cache import FileCache
+from request_log import RequestLogger
+from profiler import profiler
+from settings import settings
+from sender import SendScheduler, PRIORITY_BULK
+from broadcast import Broadcaster
+from lifecycle import JobTracker, is_replayed_job, start_job_url, finish_job_url
+from metrics import STAGE_SECONDS, REQUESTS, BYTES_UPLOADED, start_metrics_server
 
 # Setup logging
 logging.basicConfig(
@@ -35,19 +55,47 @@ logger = logging.getLogger(__name__)
 # Initialize managers
 ads_manager = AdsManager()
 downloader = VideoDownloader()
+splitter = VideoSplitter()
+file_cache = FileCache()
+request_logger = RequestLogger()
+broadcaster = Broadcaster(ads_manager)
+
+# Inline links waiting for a private-chat download (token -> url)
+inline_links = {}
+INLINE_LINKS_MAX = 1000
+
+# Previews waiting for a quality choice (token -> {"url", "info", "created"})
+pending_previews = {}
+
+# Cached videos usable for a plain link: the default download, then preview choices (best first)
+VIDEO_NAMESPACES = ("video", "video720", "video360")
+
+# Telegram allows 2-10 items per album
+ALBUM_MAX_ITEMS = 10
+
+# Per-user download slots for batch mode (user_id -> [semaphore, holders and waiters])
+user_download_slots = {}
 
 # Rate limiting
 user_last_request = {}
-RATE_LIMIT_SECONDS = 3
+
+# Shown when a queued download is saved for the next process
+RESTART_MESSAGE = (
+    "🔄 The bot is restarting.\n\n"
+    "⏳ Your link is saved and will be downloaded automatically in a moment."
+)
 
 # ============== Helper Functions ==============
 
 def is_rate_limited(user_id: int) -> bool:
     """Check if user is rate limited"""
+    # Jobs saved at shutdown arrive together on startup
+    if is_replayed_job():
+        return False
     now = datetime.now()
     if user_id in user_last_request:
         diff = (now - user_last_request[user_id]).total_seconds()
-        if diff < RATE_LIMIT_SECONDS:
+        if diff < settings.current.rate_limit_seconds:
             return True
     user_last_request[user_id] = now
     return False
@@ -83,6 +131,11 @@ def get_user_level(downloads: int) -> tuple:
     
     return current_level
 
+def get_user_weight(user_id: int) -> float:
+    """Download queue weight of a user, from their level tier"""
+    downloads = ads_manager.get_user_stats(user_id).get('downloads', 0)
+    return TIER_WEIGHTS.get(get_user_level(downloads)[2], 1)
+
 # ============== Command Handlers ==============
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -93,6 +146,16 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Register user
     ads_manager.register_user(user_id, user.first_name)
     
+    # Deep link from inline mode: /start dl_<token>
+    if context.args and context.args[0].startswith("dl_"):
+        url = inline_links.get(context.args[0][3:])
+        if url:
+            if is_rate_limited(user_id):
+                await update.message.reply_text("⏳ Please wait before next request...")
+                return
+            await deliver_video(update, context, url)
+            return
+    
     welcome_text = f"""
 🎬 Welcome {user.first_name}!
 
@@ -117,7 +180,7 @@ Just send me any video link and I'll download it for you!
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command"""
-    help_text = """
+    help_text = f"""
 ❓ User Guide
 
 📌 Available Commands:
@@ -125,6 +188,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • /help - Show help
 • /platforms - Supported platforms
 • /stats - Your statistics
+• /audio <link> - Audio only (music, podcasts)
+• /playlist <link> - Download the first videos of a playlist
+
+💡 You can send several links in one message!
 
 📥 How to download:
 1️⃣ Copy the video link
@@ -133,7 +200,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 4️⃣ Receive your video!
 
 ⚠️ Notes:
-• Max file size: 50MB
+• Max file size: {settings.current.max_file_size_mb:g}MB
 • Some videos are protected
 • Quality depends on availability
 
@@ -224,7 +291,27 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ You are not authorized!")
         return
     
-    report = ads_manager.get_admin_report()
+    report = ads_manager.get_admin_summary()
+    load = downloader.governor.report()
+    queue = downloader.scheduler.report()
+    memory = downloader.memory.report()
+    memory_text = (
+        f"{memory['used'] // (1024 * 1024)}/{memory['budget'] // (1024 * 1024)} MB, {memory['fallbacks']} sent to disk"
+        if memory['enabled'] else "disabled"
+    )
+    health_lines = []
+    for platform, h in downloader.health.report().items():
+        icon = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}[h['state']]
+        line = f"{icon} {platform}: {h['success_rate']:.0%} ok of {h['requests']}, p50 {h['p50']:.1f}s / p95 {h['p95']:.1f}s"
+        if h['state'] == "open":
+            line += f" - retry in {h['retry_in']}s" + (" (fallback)" if h['fallback'] else f", rejected {h['rejected']}")
+        health_lines.append(line)
+    health_text = "\n".join(health_lines) or "No downloads yet"
+    rate_limit = f"{load['rate_limit'] * 8 / 1_000_000:.0f} Mbps" if load['rate_limit'] else "unlimited"
+    config = settings.status()
+    config_text = f"{config['source']} ({config['ads']} ads, {config['platforms']} domains)"
+    if config['error']:
+        config_text += " - last reload failed, see /reload"
     
     admin_text = f"""
 🔐 Admin Panel
@@ -239,36 +326,327 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🖱️ Clicks: {report['ad_clicks']}
 📊 CTR: {report['ctr']}%
 
+🚦 Download Load:
+⬇️ Active Jobs: {load['active_jobs']}
+⚖️ Slots: {queue['active']}/{queue['slots']} busy, {queue['waiting']} waiting ({queue['users_waiting']} users)
+⚡ Throughput: {load['throughput'] / (1024 * 1024):.1f} MB/s (limit: {rate_limit})
+📦 Reserved: {load['reserved'] // (1024 * 1024)} MB
+💾 Free Disk: {load['free'] // (1024 * 1024)} MB
+🧠 Memory Path: {memory_text}
+⛔ Rejected (disk full): {load['rejected']}
+🚫 Failed links cached: {len(downloader.negative_cache)}
+♻️ Settings: {config_text}
+
+🩺 Platform Health:
+{health_text}
+
 ⏰ Last Update: {datetime.now().strftime('%Y-%m-%d %H:%M')}
 """
     
     await update.message.reply_text(admin_text)
 
+async def reload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /reload - re-read the settings file now"""
+    user_id = update.effective_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ You are not authorized!")
+        return
+    
+    loop = asyncio.get_running_loop()
+    if await loop.run_in_executor(None, settings.reload):
+        status = settings.status()
+        await update.message.reply_text(
+            f"♻️ Settings reloaded from {status['source']}\n\n"
+            f"📢 Active ads: {status['ads']}\n"
+            f"🌐 Supported domains: {status['platforms']}\n"
+            f"📦 Max file size: {settings.current.max_file_size_mb:g} MB\n"
+            f"⏱️ Rate limit: {settings.current.rate_limit_seconds:g}s"
+        )
+    else:
+        await update.message.reply_text(f"❌ Settings file rejected, keeping previous settings:\n\n{settings.last_error}")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /profile [on [seconds] | off | last [N]] - slow request profiling"""
+    user_id = update.effective_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ You are not authorized!")
+        return
+    
+    args = context.args or []
+    action = args[0].lower() if args else "status"
+    
+    if action in ("on", "off"):
+        threshold = None
+        if action == "on" and len(args) > 1:
+            try:
+                threshold = float(args[1])
+            except ValueError:
+                await update.message.reply_text("📝 Usage: /profile on [seconds]")
+                return
+        profiler.set_enabled(action == "on", threshold)
+    
+    elif action == "last":
+        count = int(args[1]) if len(args) > 1 and args[1].isdigit() else 1
+        traces = profiler.last(count)
+        if not traces:
+            await update.message.reply_text("📭 No slow requests recorded yet.")
+            return
+        for i, trace in enumerate(traces, 1):
+            await update.message.reply_document(
+                document=trace.report.encode("utf-8"),
+                filename=f"profile_{i}_{trace.name}_{int(trace.ts)}.txt",
+                caption=f"🐢 {trace.name} - {trace.total:.1f}s"
+            )
+        return
+    
+    elif action != "status":
+        await update.message.reply_text("📝 Usage: /profile [on [seconds] | off | last [N]]")
+        return
+    
+    status = profiler.status()
+    await update.message.reply_text(
+        f"🔬 Profiling: {'ON' if status['enabled'] else 'OFF'}\n\n"
+        f"⏱️ Slow threshold: {status['threshold']:g}s\n"
+        f"📊 Traced requests: {status['requests']}\n"
+        f"🐢 Slow profiles kept: {status['kept']}"
+    )
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /broadcast <text> | status | cancel (or reply to a message with /broadcast)"""
+    user_id = update.effective_user.id
+    
+    if user_id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ You are not authorized!")
+        return
+    
+    action = context.args[0].lower() if len(context.args or []) == 1 else None
+    
+    if action == "status":
+        if not broadcaster.state:
+            await update.message.reply_text("📭 No broadcast yet.")
+        else:
+            await update.message.reply_text(broadcaster.format_progress())
+        return
+    
+    if action == "cancel":
+        if await broadcaster.cancel():
+            await update.message.reply_text(broadcaster.format_progress())
+        else:
+            await update.message.reply_text("📭 No broadcast is running.")
+        return
+    
+    # Reply to any message to copy it as-is (media, formatting), or pass text
+    if update.message.reply_to_message:
+        source = {"from_chat_id": update.effective_chat.id, "message_id": update.message.reply_to_message.message_id}
+    elif context.args:
+        source = {"text": update.message.text.split(None, 1)[1]}
+    else:
+        await update.message.reply_text(
+            "📢 Broadcast\n\n"
+            "📝 Usage:\n"
+            "• /broadcast <text>\n"
+            "• Reply to a message with /broadcast\n"
+            "• /broadcast status\n"
+            "• /broadcast cancel"
+        )
+        return
+    
+    if not broadcaster.start(context.bot, update.effective_chat.id, source):
+        await update.message.reply_text("⏳ A broadcast is already running. Use /broadcast status")
+
+# ============== Split & Send ==============
+
+async def send_video_album(message, parts: list, title: str, total: int):
+    """Upload a batch of video parts as one ordered album"""
+    files = [open(part['path'], 'rb') for part in parts]
+    try:
+        if len(parts) == 1:
+            await message.reply_video(
+                video=files[0],
+                caption=f"🎬 {title}\n📦 Part {parts[0]['index']}/{total}",
+                duration=parts[0]['duration'],
+                supports_streaming=True
+            )
+        else:
+            media = [
+                InputMediaVideo(
+                    media=f,
+                    caption=f"🎬 {title}\n📦 Part {part['index']}/{total}",
+                    duration=part['duration'],
+                    supports_streaming=True
+                )
+                for f, part in zip(files, parts)
+            ]
+            await message.reply_media_group(media=media)
+    finally:
+        for f in files:
+            f.close()
+        for part in parts:
+            downloader.cleanup_file(part['path'])
+
+async def send_split_video(update: Update, status_msg, result: dict) -> str:
+    """
+    Cut an oversized video on keyframes and send the parts as albums
+    Returns: "split" (all parts sent), "partial" (some parts sent, status says so) or "" (nothing sent)
+    """
+    file_path = result['file_path']
+    max_bytes = int(settings.current.max_file_size_mb * 1024 * 1024)
+    
+    if not splitter.can_split(file_path, max_bytes):
+        return ""
+    
+    total = splitter.estimate_parts(file_path, max_bytes)
+    title = result.get('title', 'Video')
+    await status_msg.edit_text(f"✂️ Video is too large, sending it in ~{total} parts...")
+    
+    # Parts for the next album are cut while the current one uploads
+    batch = []
+    sent = 0
+    try:
+        async for part in splitter.stream_parts(file_path, max_bytes, prefetch=ALBUM_MAX_ITEMS):
+            total = max(total, part['index'])
+            batch.append(part)
+            if len(batch) == ALBUM_MAX_ITEMS:
+                await send_video_album(update.effective_message, batch, title, total)
+                sent += len(batch)
+                batch = []
+        if batch:
+            await send_video_album(update.effective_message, batch, title, total)
+            sent += len(batch)
+            batch = []
+    except RuntimeError as e:
+        # ffmpeg failed, too many parts, or a part can't fit the size limit
+        logger.error(f"Split error: {e}")
+        if not sent:
+            return ""
+        await status_msg.edit_text(
+            f"⚠️ Sent {sent} of ~{total} parts, the rest failed.\n\n"
+            f"Reason: {e}"
+        )
+        return "partial"
+    finally:
+        for part in batch:
+            downloader.cleanup_file(part['path'])
+    
+    return "split"
+
 # ============== Video Download Handler ==============
 
+def is_supported_link(url: str) -> bool:
+    """Quick check that the link belongs to a supported platform (hot-reloadable list)"""
+    return settings.current.is_supported(url)
+
+def begin_request(mode: str, user_id: int, url: str):
+    """Start a request record for the structured request log"""
+    return request_logger.begin(mode, user_id, downloader.get_platform_key(url), file_cache.make_key(url))
+
+def finish_request(record, outcome: str, **fields):
+    """Count the outcome and queue the record for the request log"""
+    REQUESTS.inc(record.data['mode'], outcome)
+    request_logger.log(record, outcome, **fields)
+    profiler.annotate(platform=record.data['platform'], key=record.data['key'], outcome=outcome)
+
+async def send_ad(update: Update, user_id: int, record=None):
+    """Show an ad after a delivery if enabled"""
+    if not settings.current.ads_enabled:
+        return
+    
+    with (record.stage("ad_send") if record else STAGE_SECONDS.time("ad_send")):
+        ad = ads_manager.get_smart_ad(user_id)
+        if ad:
+            ad_keyboard = InlineKeyboardMarkup([[
+                InlineKeyboardButton(ad['button_text'], url=ad['button_url'])
+            ]])
+            # Ads wait behind videos, results and progress updates
+            await update.get_bot().send_message(
+                chat_id=update.effective_chat.id,
+                text=ad['text'],
+                reply_markup=ad_keyboard,
+                disable_web_page_preview=True,
+                rate_limit_args=PRIORITY_BULK
+            )
+            ads_manager.record_ad_shown(user_id, ad['id'])
+
 async def handle_video_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle video URL messages"""
     user_id = update.effective_user.id
-    url = update.message.text.strip()
     
     # Rate limiting
     if is_rate_limited(user_id):
         await update.message.reply_text("⏳ Please wait before next request...")
         return
     
+    classify_started = time.perf_counter()
+    urls = downloader.extract_urls(update.message.text)
+    supported = [u for u in urls if is_supported_link(u)]
+    # One supported link among others: use it, not the first link of the message
+    url = supported[0] if supported else (urls[0] if urls else update.message.text.strip())
+    valid = is_supported_link(url)
+    classify_time = time.perf_counter() - classify_started
+    STAGE_SECONDS.observe(classify_time, "classify")
+    
+    # Several links in one message
+    if len(supported) > 1:
+        await handle_batch(update, context, supported)
+        return
+    
+    record = begin_request("video", user_id, url)
+    record.add_stages({"classify": classify_time})
+    
     # Check if URL is valid
-    if not any(platform in url.lower() for platform in ['youtube', 'youtu.be', 'tiktok', 'instagram', 
-                                                         'twitter', 'x.com', 'facebook', 'fb.', 
-                                                         'vimeo', 'dailymotion', 'twitch', 'reddit',
-                                                         'pinterest', 'soundcloud', 'telegram', 't.me']):
+    if not valid:
+        finish_request(record, "unsupported")
         await update.message.reply_text(
             "❌ Unsupported link!\n\n"
             "📋 Use /platforms to see supported platforms."
         )
         return
     
+    # Optional: show info and quality buttons first, download on tap
+    if PREVIEW_FIRST_ENABLED:
+        await send_preview(update, url, record)
+        return
+    
+    await deliver_video(update, context, url, record)
+
+@profiler.request("video")
+async def deliver_video(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, record=None,
+                        quality: str = None, info: dict = None):
+    """Download a single video and send it to the chat (quality/info come from a preview)"""
+    user_id = update.effective_user.id
+    message = update.effective_message
+    record = record or begin_request("video", user_id, url)
+    namespace = f"video{quality}" if quality else "video"
+    start_job_url(url)
+    
+    # Already delivered before: resend by file_id without downloading
+    found, cached = file_cache.find((namespace,) if quality else VIDEO_NAMESPACES, url)
+    if cached:
+        try:
+            with record.stage("upload"), profiler.span("reply_video"):
+                await message.reply_video(
+                    video=cached['file_id'],
+                    caption=f"✅ Downloaded successfully!\n\n🎬 {cached.get('title', 'Video')}"
+                )
+        except BadRequest as e:
+            # Telegram no longer knows this file_id: forget it and download again
+            logger.warning(f"Cached video rejected, downloading again: {e}")
+            file_cache.evict(found, url)
+        except TelegramError as e:
+            finish_request(record, "error", error_class=type(e).__name__)
+            logger.error(f"Cached send error: {e}")
+            return
+        else:
+            finish_job_url(url)
+            ads_manager.record_download(user_id)
+            await send_ad(update, user_id, record)
+            finish_request(record, "cached")
+            return
+    
     # Send processing message
-    status_msg = await update.message.reply_text(
+    status_msg = await message.reply_text(
         "⏳ Downloading...\n\n"
         "🔄 Please wait..."
     )
@@ -278,7 +656,9 @@ async def handle_video_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="upload_video")
         
         # Download video
-        result = await downloader.download_video(url, user_id)
+        result = await downloader.download_video(url, user_id, weight=get_user_weight(user_id), quality=quality, info=info)
+        record.add_stages(result.get('timings'))
+        record.set(video_id=result.get('video_id'), bytes=result.get('file_size'), negative_cache=result.get('negative_cached'), storage=result.get('storage'))
         
         if result['success']:
             file_path = result['file_path']
@@ -286,12 +666,20 @@ async def handle_video_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Update status
             await status_msg.edit_text("📤 Sending video...")
             
-            # Send video
-            with open(file_path, 'rb') as video_file:
-                await update.message.reply_video(
-                    video=video_file,
-                    caption=f"✅ Downloaded successfully!\n\n🎬 {result.get('title', 'Video')}"
-                )
+            # Send video (the file is removed even if the upload fails: tmpfs files hold the memory budget)
+            try:
+                with record.stage("upload"), profiler.span("reply_video"), open(file_path, 'rb') as video_file:
+                    sent = await message.reply_video(
+                        video=video_file,
+                        caption=f"✅ Downloaded successfully!\n\n🎬 {result.get('title', 'Video')}"
+                    )
+            finally:
+                downloader.cleanup_file(file_path)
+            finish_job_url(url)
+            BYTES_UPLOADED.inc(downloader.get_platform_key(url), amount=result.get('file_size', 0))
+            
+            if sent.video:
+                file_cache.put(namespace, url, sent.video.file_id, title=result.get('title', 'Video'))
             
             # Delete status message
             await status_msg.delete()
@@ -300,25 +688,39 @@ async def handle_video_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ads_manager.record_download(user_id)
             
             # Show ad if enabled
-            if ADS_ENABLED:
-                ad = ads_manager.get_smart_ad(user_id)
-                if ad:
-                    ad_keyboard = InlineKeyboardMarkup([[
-                        InlineKeyboardButton(ad['button_text'], url=ad['url'])
-                    ]])
-                    await update.message.reply_text(
-                        ad['text'],
-                        reply_markup=ad_keyboard,
-                        disable_web_page_preview=True
-                    )
-            
-            # Cleanup
+            await send_ad(update, user_id, record)
+            finish_request(record, "success")
+                
+        elif result.get('too_large'):
             try:
-                os.remove(file_path)
-            except:
-                pass
+                with record.stage("upload"), profiler.span("send_split_video"):
+                    sent = await send_split_video(update, status_msg, result)
+            finally:
+                downloader.cleanup_file(result['file_path'])
+            
+            if sent == "split":
+                finish_job_url(url)
+                finish_request(record, "split")
+                await status_msg.delete()
+                ads_manager.record_download(user_id)
+            elif sent == "partial":
+                # Parts already reached the user: don't replay the whole video after a restart
+                finish_job_url(url)
+                finish_request(record, "split_partial", error_class="split_failed")
+            else:
+                finish_request(record, "failed", error_class=result.get('error_class'))
+                await status_msg.edit_text(
+                    f"❌ Download failed!\n\n"
+                    f"Reason: {result.get('error', 'Unknown error')}\n\n"
+                    f"💡 Try another link or check the URL."
+                )
+                
+        elif result.get('error_class') == "shutdown":
+            finish_request(record, "deferred", error_class="shutdown")
+            await status_msg.edit_text(RESTART_MESSAGE)
                 
         else:
+            finish_request(record, "failed", error_class=result.get('error_class'))
             await status_msg.edit_text(
                 f"❌ Download failed!\n\n"
                 f"Reason: {result.get('error', 'Unknown error')}\n\n"
@@ -326,17 +728,425 @@ async def handle_video_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             
     except asyncio.TimeoutError:
+        finish_request(record, "timeout", error_class="timeout")
         await status_msg.edit_text(
             "⏰ Download timeout!\n\n"
             "💡 Video is too large or server is slow."
         )
     except Exception as e:
+        finish_request(record, "error", error_class=type(e).__name__)
         logger.error(f"Download error: {e}")
         await status_msg.edit_text(
             "❌ Unexpected error!\n\n"
             "💡 Please try again later."
         )
 
+async def audio_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /audio <link> - send only the audio track"""
+    user_id = update.effective_user.id
+    
+    if not context.args:
+        await update.message.reply_text(
+            "🎵 Audio only\n\n"
+            "📝 Usage: /audio <video link>"
+        )
+        return
+    url = context.args[0].strip()
+    
+    # Rate limiting
+    if is_rate_limited(user_id):
+        await update.message.reply_text("⏳ Please wait before next request...")
+        return
+    
+    record = begin_request("audio", user_id, url)
+    
+    if not is_supported_link(url):
+        finish_request(record, "unsupported")
+        await update.message.reply_text(
+            "❌ Unsupported link!\n\n"
+            "📋 Use /platforms to see supported platforms."
+        )
+        return
+    
+    await deliver_audio(update, context, url, record)
+
+@profiler.request("audio")
+async def deliver_audio(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, record=None, info: dict = None):
+    """Extract the audio track of a video and send it to the chat"""
+    user_id = update.effective_user.id
+    message = update.effective_message
+    record = record or begin_request("audio", user_id, url)
+    start_job_url(url)
+    
+    cached = file_cache.get("audio", url)
+    if cached:
+        try:
+            with record.stage("upload"), profiler.span("reply_audio"):
+                await message.reply_audio(audio=cached['file_id'])
+        except BadRequest as e:
+            logger.warning(f"Cached audio rejected, extracting again: {e}")
+            file_cache.evict("audio", url)
+        except TelegramError as e:
+            finish_request(record, "error", error_class=type(e).__name__)
+            logger.error(f"Cached send error: {e}")
+            return
+        else:
+            finish_job_url(url)
+            ads_manager.record_download(user_id)
+            await send_ad(update, user_id, record)
+            finish_request(record, "cached")
+            return
+    
+    status_msg = await message.reply_text(
+        "⏳ Extracting audio...\n\n"
+        "🔄 Please wait..."
+    )
+    
+    try:
+        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="upload_voice")
+        
+        result = await downloader.download_audio(url, user_id, weight=get_user_weight(user_id), info=info)
+        record.add_stages(result.get('timings'))
+        record.set(video_id=result.get('video_id'), bytes=result.get('file_size'), negative_cache=result.get('negative_cached'), storage=result.get('storage'))
+        
+        if result['success']:
+            file_path = result['file_path']
+            await status_msg.edit_text("📤 Sending audio...")
+            
+            try:
+                with record.stage("upload"), profiler.span("reply_audio"), open(file_path, 'rb') as audio_file:
+                    sent = await message.reply_audio(
+                        audio=audio_file,
+                        title=result.get('title'),
+                        performer=result.get('performer'),
+                        duration=int(result.get('duration') or 0) or None,
+                        caption="✅ Audio extracted successfully!"
+                    )
+            finally:
+                downloader.cleanup_file(file_path)
+            finish_job_url(url)
+            BYTES_UPLOADED.inc(downloader.get_platform_key(url), amount=result.get('file_size', 0))
+            
+            if sent.audio:
+                file_cache.put("audio", url, sent.audio.file_id, title=result.get('title', 'Audio'))
+            
+            await status_msg.delete()
+            ads_manager.record_download(user_id)
+            await send_ad(update, user_id, record)
+            finish_request(record, "success")
+        elif result.get('error_class') == "shutdown":
+            finish_request(record, "deferred", error_class="shutdown")
+            await status_msg.edit_text(RESTART_MESSAGE)
+        else:
+            finish_request(record, "failed", error_class=result.get('error_class'))
+            await status_msg.edit_text(
+                f"❌ Download failed!\n\n"
+                f"Reason: {result.get('error', 'Unknown error')}\n\n"
+                f"💡 Try another link or check the URL."
+            )
+            
+    except Exception as e:
+        finish_request(record, "error", error_class=type(e).__name__)
+        logger.error(f"Audio error: {e}")
+        await status_msg.edit_text(
+            "❌ Unexpected error!\n\n"
+            "💡 Please try again later."
+        )
+
+# ============== Preview Handler ==============
+
+def format_size(size) -> str:
+    """Approximate size for a quality button ('' when unknown)"""
+    if not size:
+        return ""
+    return f" ~{size / (1024 * 1024):.0f}MB" if size >= 1024 * 1024 else " <1MB"
+
+async def send_preview(update: Update, url: str, record):
+    """Reply with title, duration and quality buttons; nothing is downloaded yet"""
+    status_msg = await update.message.reply_text("🔎 Fetching video info...")
+    preview = await downloader.preview(url)
+    record.add_stages(preview.get('timings'))
+    
+    if not preview['success']:
+        finish_request(record, "failed", error_class=preview.get('error_class'))
+        await status_msg.edit_text(
+            f"❌ Download failed!\n\n"
+            f"Reason: {preview.get('error', 'Unknown error')}\n\n"
+            f"💡 Try another link or check the URL."
+        )
+        return
+    
+    # Keep the extracted info: the chosen download reuses it
+    token = file_cache.make_token(url)
+    pending_previews.pop(token, None)
+    pending_previews[token] = {"url": url, "info": preview['info'], "created": time.time()}
+    while len(pending_previews) > PREVIEW_MAX_PENDING:
+        pending_previews.pop(next(iter(pending_previews)))
+    
+    sizes = preview['sizes']
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton(f"🎬 360p{format_size(sizes.get('360'))}", callback_data=f"q_{token}_360"),
+        InlineKeyboardButton(f"🎬 720p{format_size(sizes.get('720'))}", callback_data=f"q_{token}_720"),
+        InlineKeyboardButton(f"🎵 Audio{format_size(sizes.get('audio'))}", callback_data=f"q_{token}_audio"),
+    ]])
+    minutes, seconds = divmod(int(preview['duration']), 60)
+    caption = (
+        f"🎬 {preview['title']}\n"
+        f"⏱️ Duration: {minutes}:{seconds:02d}\n\n"
+        f"👇 Choose a quality to download:"
+    )
+    
+    sent = False
+    if preview['thumbnail']:
+        try:
+            await update.message.reply_photo(photo=preview['thumbnail'], caption=caption, reply_markup=keyboard)
+            sent = True
+        except TelegramError:
+            # Telegram could not fetch the thumbnail: text only
+            pass
+    if sent:
+        await status_msg.delete()
+    else:
+        await status_msg.edit_text(caption, reply_markup=keyboard)
+    finish_request(record, "preview")
+
+async def handle_quality_choice(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str):
+    """Start the download picked from a preview (q_<token>_<quality>)"""
+    query = update.callback_query
+    _, token, quality = data.split("_", 2)
+    
+    # One download per preview
+    preview = pending_previews.pop(token, None)
+    if not preview or time.time() - preview['created'] > PREVIEW_TTL_SECONDS:
+        await query.message.reply_text("⌛ This preview has expired. Send the link again.")
+        return
+    
+    try:
+        await query.edit_message_reply_markup(reply_markup=None)
+    except TelegramError:
+        pass
+    
+    if quality == "audio":
+        await deliver_audio(update, context, preview['url'], info=preview['info'])
+    else:
+        await deliver_video(update, context, preview['url'], quality=quality, info=preview['info'])
+
+# ============== Batch Handler ==============
+
+@asynccontextmanager
+async def user_slot(user_id: int):
+    """Hold one of the user's parallel download slots (dropped when nobody uses it)"""
+    entry = user_download_slots.setdefault(user_id, [asyncio.Semaphore(MAX_PARALLEL_DOWNLOADS_PER_USER), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            user_download_slots.pop(user_id, None)
+
+async def download_batch_item(url: str, user_id: int) -> dict:
+    """Download one batch item, served from the file_id cache when possible"""
+    record = begin_request("batch", user_id, url)
+    _, cached = file_cache.find(VIDEO_NAMESPACES, url)
+    if cached:
+        return {"success": True, "url": url, "file_id": cached['file_id'], "title": cached.get('title', 'Video'), "record": record}
+    
+    async with user_slot(user_id):
+        result = await downloader.download_video(url, user_id, weight=get_user_weight(user_id))
+    result['url'] = url
+    result['record'] = record
+    record.add_stages(result.get('timings'))
+    record.set(video_id=result.get('video_id'), bytes=result.get('file_size'), negative_cache=result.get('negative_cached'), storage=result.get('storage'))
+    
+    # Oversized videos are not split inside albums
+    if result.get('too_large'):
+        downloader.cleanup_file(result['file_path'])
+        result['success'] = False
+    return result
+
+async def send_results_album(message, items: list):
+    """Send up to 10 downloaded videos as one album and cache their file_ids"""
+    files = []
+    media = []
+    for item in items:
+        if item.get('file_id'):
+            source = item['file_id']
+        else:
+            source = open(item['file_path'], 'rb')
+            files.append(source)
+        media.append(InputMediaVideo(media=source, caption=f"🎬 {item.get('title', 'Video')}", supports_streaming=True))
+    
+    try:
+        if len(media) == 1:
+            messages = [await message.reply_video(video=media[0].media, caption=media[0].caption)]
+        else:
+            messages = await message.reply_media_group(media=media)
+    finally:
+        for f in files:
+            f.close()
+        for item in items:
+            if item.get('file_path'):
+                downloader.cleanup_file(item['file_path'])
+    
+    for item, sent in zip(items, messages):
+        if sent.video and not item.get('file_id'):
+            file_cache.put("video", item['url'], sent.video.file_id, title=item.get('title', 'Video'))
+
+@profiler.request("batch")
+async def handle_batch(update: Update, context: ContextTypes.DEFAULT_TYPE, urls: list):
+    """Download several links in parallel and deliver them as albums"""
+    user_id = update.effective_user.id
+    skipped = max(0, len(urls) - BATCH_MAX_LINKS)
+    urls = urls[:BATCH_MAX_LINKS]
+    
+    status_msg = await update.message.reply_text(
+        f"⏳ Downloading {len(urls)} videos...\n\n"
+        "🔄 Please wait..."
+    )
+    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="upload_video")
+    for url in urls:
+        start_job_url(url)
+    
+    results = await asyncio.gather(
+        *(download_batch_item(url, user_id) for url in urls),
+        return_exceptions=True
+    )
+    
+    done = [r for r in results if isinstance(r, dict) and r.get('success')]
+    deferred = sum(1 for r in results if isinstance(r, dict) and r.get('error_class') == "shutdown")
+    failed = len(results) - len(done) - deferred
+    for r in results:
+        if isinstance(r, dict) and r.get('error_class') == "shutdown":
+            finish_request(r['record'], "deferred", error_class="shutdown")
+        elif isinstance(r, dict) and not r.get('success'):
+            finish_request(r['record'], "failed", error_class=r.get('error_class') or ("too_large" if r.get('too_large') else None))
+        elif not isinstance(r, dict):
+            REQUESTS.inc("batch", "error")
+    
+    try:
+        if done:
+            await status_msg.edit_text(f"📤 Sending {len(done)} videos...")
+        for i in range(0, len(done), ALBUM_MAX_ITEMS):
+            album = done[i:i + ALBUM_MAX_ITEMS]
+            started = time.perf_counter()
+            with profiler.span("send_results_album"):
+                await send_results_album(update.message, album)
+            upload_time = time.perf_counter() - started
+            STAGE_SECONDS.observe(upload_time, "upload")
+            for item in album:
+                finish_job_url(item['url'])
+                item['record'].add_stages({"upload": upload_time})
+                finish_request(item['record'], "cached" if item.get('file_id') else "success")
+    except Exception as e:
+        logger.error(f"Batch send error: {e}")
+        for item in done:
+            if item.get('file_path'):
+                downloader.cleanup_file(item['file_path'])
+            if 'outcome' not in item['record'].data:
+                finish_request(item['record'], "error", error_class=type(e).__name__)
+        await status_msg.edit_text(
+            "❌ Unexpected error!\n\n"
+            "💡 Please try again later."
+        )
+        return
+    
+    for _ in done:
+        ads_manager.record_download(user_id)
+    
+    if failed or skipped or deferred:
+        summary = f"✅ Sent {len(done)}/{len(urls)} videos"
+        if failed:
+            summary += f"\n❌ Failed: {failed}"
+        if deferred:
+            summary += f"\n🔄 Bot is restarting, {deferred} will be downloaded in a moment"
+        if skipped:
+            summary += f"\n⚠️ Skipped {skipped} links (max {BATCH_MAX_LINKS} per message)"
+        await status_msg.edit_text(summary)
+    else:
+        await status_msg.delete()
+    
+    if done:
+        await send_ad(update, user_id)
+
+async def playlist_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /playlist <link> - download the first items of a playlist"""
+    user_id = update.effective_user.id
+    
+    if not context.args:
+        await update.message.reply_text(
+            "📚 Playlist mode\n\n"
+            f"📝 Usage: /playlist <playlist link>\n"
+            f"⚠️ Up to {PLAYLIST_MAX_ITEMS} videos"
+        )
+        return
+    url = context.args[0].strip()
+    
+    if is_rate_limited(user_id):
+        await update.message.reply_text("⏳ Please wait before next request...")
+        return
+    
+    if not is_supported_link(url):
+        await update.message.reply_text(
+            "❌ Unsupported link!\n\n"
+            "📋 Use /platforms to see supported platforms."
+        )
+        return
+    
+    urls = await downloader.expand_playlist(url, PLAYLIST_MAX_ITEMS)
+    if not urls:
+        await update.message.reply_text("❌ Could not read this playlist.")
+        return
+    
+    await handle_batch(update, context, urls)
+
+# ============== Inline Mode ==============
+
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer @bot <link> from the file_id cache only (no downloads here)"""
+    query = update.inline_query
+    url = downloader.extract_url(query.query)
+    
+    if not url or not is_supported_link(url):
+        await query.answer([], cache_time=300)
+        return
+    
+    results = []
+    _, video = file_cache.find(VIDEO_NAMESPACES, url)
+    if video:
+        results.append(InlineQueryResultCachedVideo(
+            id="v",
+            video_file_id=video['file_id'],
+            title=video.get('title', 'Video')
+        ))
+    audio = file_cache.get("audio", url)
+    if audio:
+        results.append(InlineQueryResultCachedAudio(id="a", audio_file_id=audio['file_id']))
+    
+    record = begin_request("inline", update.effective_user.id, url)
+    if results:
+        with record.stage("upload"):
+            await query.answer(results, cache_time=300)
+        finish_request(record, "cached")
+        return
+    
+    finish_request(record, "deep_link")
+    
+    # Not delivered yet: offer a deep link into the private chat
+    token = file_cache.make_token(url)
+    inline_links.pop(token, None)
+    inline_links[token] = url
+    while len(inline_links) > INLINE_LINKS_MAX:
+        inline_links.pop(next(iter(inline_links)))
+    
+    await query.answer(
+        [],
+        cache_time=5,
+        is_personal=True,
+        button=InlineQueryResultsButton(text="📥 Download in private chat", start_parameter=f"dl_{token}")
+    )
+
 # ============== Callback Handler ==============
 
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -365,45 +1175,155 @@ YouTube, TikTok, Instagram, Twitter, Facebook & more!
             welcome_text,
             reply_markup=get_main_keyboard()
         )
+    elif data.startswith("q_"):
+        await handle_quality_choice(update, context, data)
     elif data.startswith("ad_click_"):
         ads_manager.record_ad_click(query.from_user.id)
 
 # ============== Main ==============
 
-def main():
-    """Main function"""
-    print("=" * 50)
-    print("Video Downloader Pro Bot")
-    print("=" * 50)
-    print("Starting...")
+def is_download_job(update: Update) -> bool:
+    """Updates worth replaying after a restart: links, batches, /audio and /playlist"""
+    text = (update.message.text or "") if update.message else ""
+    if text.startswith("/"):
+        return text.split()[0].split("@")[0] in ("/audio", "/playlist")
+    return any(is_supported_link(url) for url in downloader.extract_urls(text))
+
+# Tracks running updates so shutdown can drain them and save unfinished downloads
+job_tracker = JobTracker(MAX_CONCURRENT_UPDATES, is_download_job)
+
+def request_shutdown(app: Application):
+    """SIGTERM/SIGINT: stop taking jobs, let running ones finish, then stop the bot"""
+    if job_tracker.draining:
+        # Second signal: don't wait for the deadline
+        job_tracker.drop_all()
+        return
+    queued = downloader.scheduler.close()
+    logger.info(f"Shutting down: {len(job_tracker.jobs)} jobs in flight ({queued} queued), waiting up to {SHUTDOWN_DRAIN_SECONDS}s")
+    job_tracker.begin_drain(SHUTDOWN_DRAIN_SECONDS)
+    app.stop_running()
+
+async def on_startup(app: Application):
+    """Start background services inside the bot's event loop"""
+    if METRICS_ENABLED:
+        try:
+            app.bot_data['metrics_server'] = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+            logger.info(f"Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            logger.error(f"Metrics server failed to start: {e}")
     
-    # Create application
-    app = Application.builder().token(BOT_TOKEN).build()
+    request_logger.start()
+    
+    # Apply edits to the settings file without a restart
+    app.bot_data['settings_watcher'] = asyncio.create_task(settings.watch(SETTINGS_POLL_SECONDS))
+    
+    # New file_ids are written to disk in batches, not on every upload
+    app.bot_data['cache_autosave'] = asyncio.create_task(file_cache.autosave(CACHE_SAVE_INTERVAL_SECONDS))
+    
+    # yt-dlp import and directory sweeps run after polling has started
+    app.bot_data['maintenance'] = asyncio.create_task(downloader.maintenance_loop(WARMUP_DELAY_SECONDS))
+    
+    # Continue a broadcast interrupted by a restart
+    if broadcaster.resume(app.bot):
+        logger.info("Resuming broadcast")
+    
+    # Jobs saved by the previous process run before new updates
+    pending = job_tracker.load_pending()
+    for data in pending:
+        await app.update_queue.put(Update.de_json(data, app.bot))
+    if pending:
+        logger.info(f"Resuming {len(pending)} jobs saved at shutdown")
     
-    # Add handlers
+    # Own stop signals so in-flight jobs get SHUTDOWN_DRAIN_SECONDS (not supported on Windows)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, request_shutdown, app)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+async def on_shutdown(app: Application):
+    """Stop background tasks, flush state to disk and report the shutdown"""
+    for name in ('maintenance', 'settings_watcher', 'cache_autosave'):
+        task = app.bot_data.pop(name, None)
+        if task:
+            task.cancel()
+    await broadcaster.stop()
+    await request_logger.stop()
+    
+    job_tracker.save_pending()
+    ads_manager.flush()
+    file_cache.flush()
+    removed = downloader.cleanup_temp_files()
+    
+    if job_tracker.draining:
+        report = job_tracker.report()
+        logger.info(
+            f"Shutdown finished in {report['duration']:.1f}s: {report['finished']} jobs finished, "
+            f"{report['deferred']} deferred, {report['dropped']} dropped, "
+            f"{report['saved']} saved for the next start, {removed} temp files removed"
+        )
+
+def register_handlers(app: Application):
+    """Attach all bot handlers to an application"""
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("platforms", platforms_command))
     app.add_handler(CommandHandler("stats", stats_command))
     app.add_handler(CommandHandler("admin", admin_command))
+    app.add_handler(CommandHandler("profile", profile_command))
+    app.add_handler(CommandHandler("reload", reload_command))
+    app.add_handler(CommandHandler("broadcast", broadcast_command))
+    app.add_handler(CommandHandler("audio", audio_command))
+    app.add_handler(CommandHandler("playlist", playlist_command))
     
     # Callback handler
     app.add_handler(CallbackQueryHandler(callback_handler))
     
+    # Inline mode (@bot <link>)
+    app.add_handler(InlineQueryHandler(inline_query_handler))
+    
     # URL handler
     app.add_handler(MessageHandler(
         filters.TEXT & ~filters.COMMAND & filters.Regex(r'https?://'),
         handle_video_url
     ))
+
+def build_application(builder=None) -> Application:
+    """Create the application with handlers and startup/shutdown hooks"""
+    builder = builder or Application.builder()
+    app = (
+        builder.token(BOT_TOKEN)
+        .rate_limiter(SendScheduler())
+        # Downloads wait in the fair-share queue instead of blocking other updates;
+        # the tracker also knows which jobs to drain or save on shutdown
+        .concurrent_updates(job_tracker)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    register_handlers(app)
+    return app
+
+def main():
+    """Main function"""
+    print("=" * 50)
+    print("Video Downloader Pro Bot")
+    print("=" * 50)
+    print("Starting...")
+    
+    # Create application
+    app = build_application()
     
     print("Bot is ready!")
     print("-" * 50)
-    print("Commands: /start /help /platforms /stats /admin")
+    print("Commands: /start /help /platforms /stats /audio /playlist /admin /profile /broadcast /reload")
     print("-" * 50)
     print("Bot is running... (Ctrl+C to stop)")
     
     # Run bot
-    app.run_polling(drop_pending_updates=True)
+    # Stop signals are handled in on_startup (graceful drain)
+    app.run_polling(drop_pending_updates=True, stop_signals=None)
 
 if __name__ == "__main__":
     main()
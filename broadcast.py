@@ -0,0 +1,229 @@
+# 📢 إرسال رسالة لكل المستخدمين (للمشرف)
+# ================================
+# - المستخدمون يُقرأون على صفحات من نقطة التقدم بترتيب ثابت (حسب المعرف)، بدون نسخ القائمة كاملة
+# - الإرسال يمر عبر SendScheduler بأولوية منخفضة (لا يعطل ردود البوت)
+# - بعد كل دفعة تُحفظ نقطة التقدم، فيُستكمل الإرسال بعد إعادة التشغيل
+# - من حظر البوت يُعلَّم غير نشط ولا يُرسل له مرة أخرى
+
+import os
+import json
+import time
+import asyncio
+from telegram.error import Forbidden, BadRequest, TelegramError
+from config import (
+    BROADCAST_STATE_FILE, BROADCAST_BATCH_SIZE, BROADCAST_PAGE_SIZE, BROADCAST_RATE, BROADCAST_REPORT_SECONDS
+)
+from sender import PRIORITY_BULK
+
+
+class Broadcaster:
+    def __init__(self, ads_manager, path: str = BROADCAST_STATE_FILE):
+        self.ads_manager = ads_manager
+        self.path = path
+        self.state = self.load()
+        self._task = None
+        self._session_started = 0.0
+        self._session_done = 0
+        self._last_report = 0.0
+
+    def load(self):
+        """تحميل حالة آخر إرسال"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save(self):
+        """حفظ نقطة التقدم (كتابة ذرية)"""
+        try:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"Error saving broadcast state: {e}")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot, admin_chat_id: int, source: dict) -> bool:
+        """
+        بدء إرسال جديد
+        source: {"text": ...} أو {"from_chat_id": ..., "message_id": ...}
+        """
+        if self.running:
+            return False
+        self.state = {
+            "status": "running",
+            "source": source,
+            "admin_chat_id": admin_chat_id,
+            "progress_message_id": None,
+            "cursor": 0,
+            "total": self.ads_manager.count_active_users(),
+            "sent": 0,
+            "failed": 0,
+            "blocked": 0,
+            "started_at": time.time(),
+        }
+        self.save()
+        self._task = asyncio.create_task(self._run(bot))
+        return True
+
+    def resume(self, bot) -> bool:
+        """استكمال إرسال توقف بسبب إعادة التشغيل"""
+        if self.running or not self.state or self.state.get("status") != "running":
+            return False
+        self._task = asyncio.create_task(self._run(bot))
+        return True
+
+    async def stop(self):
+        """إيقاف المهمة عند إغلاق البوت (الحالة تبقى للاستكمال لاحقاً)"""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def cancel(self) -> bool:
+        """إلغاء الإرسال نهائياً"""
+        if not self.state or self.state.get("status") != "running":
+            return False
+        await self.stop()
+        self.state["status"] = "cancelled"
+        self.save()
+        return True
+
+    def progress(self) -> dict:
+        """التقدم الحالي مع السرعة والوقت المتبقي"""
+        state = self.state or {}
+        done = state.get("sent", 0) + state.get("failed", 0) + state.get("blocked", 0)
+        total = max(state.get("total", 0), done)
+        elapsed = time.monotonic() - self._session_started if self._session_started else 0
+        rate = self._session_done / elapsed if elapsed > 0 else 0.0
+        return {
+            "status": state.get("status", "idle"),
+            "done": done,
+            "total": total,
+            "sent": state.get("sent", 0),
+            "failed": state.get("failed", 0),
+            "blocked": state.get("blocked", 0),
+            "rate": rate,
+            "eta": (total - done) / rate if rate > 0 else None,
+        }
+
+    def format_progress(self) -> str:
+        p = self.progress()
+        percent = p['done'] / p['total'] * 100 if p['total'] else 100
+        eta = "-"
+        if p['eta'] is not None:
+            minutes, seconds = divmod(int(p['eta']), 60)
+            eta = f"{minutes}m {seconds:02d}s"
+        status = {"running": "⏳ Sending", "done": "✅ Finished", "cancelled": "⛔ Cancelled"}.get(p['status'], p['status'])
+        return (
+            f"📢 Broadcast - {status}\n\n"
+            f"📊 Progress: {p['done']}/{p['total']} ({percent:.0f}%)\n"
+            f"✅ Sent: {p['sent']}\n"
+            f"🚫 Blocked: {p['blocked']}\n"
+            f"❌ Failed: {p['failed']}\n"
+            f"⚡ Speed: {p['rate']:.1f} msg/s\n"
+            f"⏱️ ETA: {eta}"
+        )
+
+    async def _send_one(self, bot, user_id: int) -> str:
+        source = self.state["source"]
+        try:
+            if "text" in source:
+                await bot.send_message(chat_id=user_id, text=source["text"], rate_limit_args=PRIORITY_BULK)
+            else:
+                await bot.copy_message(
+                    chat_id=user_id,
+                    from_chat_id=source["from_chat_id"],
+                    message_id=source["message_id"],
+                    rate_limit_args=PRIORITY_BULK
+                )
+            return "sent"
+        except Forbidden:
+            return "blocked"
+        except BadRequest as e:
+            if "chat not found" in str(e).lower():
+                return "blocked"
+            return "failed"
+        except TelegramError:
+            return "failed"
+
+    async def _report(self, bot, force: bool = False):
+        """تحديث رسالة التقدم عند المشرف"""
+        now = time.monotonic()
+        if not force and now - self._last_report < BROADCAST_REPORT_SECONDS:
+            return
+        self._last_report = now
+        try:
+            if self.state.get("progress_message_id"):
+                await bot.edit_message_text(
+                    chat_id=self.state["admin_chat_id"],
+                    message_id=self.state["progress_message_id"],
+                    text=self.format_progress()
+                )
+            else:
+                message = await bot.send_message(chat_id=self.state["admin_chat_id"], text=self.format_progress())
+                self.state["progress_message_id"] = message.message_id
+        except TelegramError as e:
+            if "not modified" not in str(e).lower():
+                print(f"Error updating broadcast progress: {e}")
+
+    async def _run(self, bot):
+        try:
+            await self._send_all(bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # الحالة تبقى "running" ليتم الاستكمال بعد إعادة التشغيل
+            print(f"Error in broadcast: {e}")
+
+    def _batches(self, cursor: int):
+        """
+        دفعات المستخدمين بعد نقطة التقدم (صفحة BROADCAST_PAGE_SIZE في كل قراءة).
+        من يسجل أثناء الإرسال ومعرفه بعد النقطة يصله أيضاً.
+        """
+        while True:
+            page = self.ads_manager.get_active_user_ids(after=cursor, limit=BROADCAST_PAGE_SIZE)
+            if not page:
+                return
+            for i in range(0, len(page), BROADCAST_BATCH_SIZE):
+                yield page[i:i + BROADCAST_BATCH_SIZE]
+            cursor = page[-1]
+
+    async def _send_all(self, bot):
+        self._session_started = time.monotonic()
+        self._session_done = 0
+        await self._report(bot, force=True)
+
+        for batch in self._batches(self.state["cursor"]):
+            batch_started = time.monotonic()
+
+            results = await asyncio.gather(*(self._send_one(bot, uid) for uid in batch))
+            for user_id, outcome in zip(batch, results):
+                self.state[outcome] += 1
+                if outcome == "blocked":
+                    self.ads_manager.mark_inactive(user_id)
+            if "blocked" in results:
+                self.ads_manager.save_users()
+
+            self.state["cursor"] = batch[-1]
+            self._session_done += len(batch)
+            self.save()
+            await self._report(bot)
+
+            # عدم تجاوز BROADCAST_RATE
+            min_duration = len(batch) / BROADCAST_RATE
+            elapsed = time.monotonic() - batch_started
+            if elapsed < min_duration:
+                await asyncio.sleep(min_duration - elapsed)
+
+        self.state["status"] = "done"
+        self.save()
+        await self._report(bot, force=True)
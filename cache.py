@@ -0,0 +1,169 @@
+# 🗂️ كاش ملفات Telegram (file_id)
+# ================================
+
+import json
+import time
+import asyncio
+import hashlib
+from urllib.parse import urlparse, parse_qsl, urlencode
+from collections import OrderedDict
+from config import CACHE_FILE, CACHE_MAX_ENTRIES, NEGATIVE_CACHE_TTLS, NEGATIVE_CACHE_MAX_ENTRIES
+from metrics import CACHE_LOOKUPS, NEGATIVE_CACHE_HITS
+from ads_manager import write_json
+
+# بارامترات التتبع التي لا تغير الفيديو
+TRACKING_PARAMS = {"si", "feature", "igshid", "igsh", "fbclid", "gclid", "ref", "s", "t", "is_from_webapp", "sender_device"}
+
+
+class FileCache:
+    def __init__(self, path: str = CACHE_FILE):
+        self.path = path
+        self.entries = self.load()
+        # تعديلات لم تُكتب بعد (الحفظ كل CACHE_SAVE_INTERVAL_SECONDS وليس بعد كل رفع)
+        self.dirty = False
+
+    def load(self):
+        """تحميل الكاش"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self):
+        """حفظ الكاش (كتابة ذرية)"""
+        try:
+            write_json(self.path, self.entries)
+            self.dirty = False
+        except Exception as e:
+            print(f"Error saving cache: {e}")
+
+    def flush(self):
+        """حفظ التعديلات المعلقة فقط (دورياً وعند إيقاف البوت)"""
+        if self.dirty:
+            self.save()
+
+    async def autosave(self, interval: float):
+        """تجميع التعديلات وحفظها كل interval ثانية"""
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+    @staticmethod
+    def make_key(url: str) -> str:
+        """توحيد الرابط ليصبح مفتاحاً ثابتاً"""
+        parsed = urlparse(url.strip())
+        domain = parsed.netloc.lower()
+        for prefix in ("www.", "m.", "mobile."):
+            if domain.startswith(prefix):
+                domain = domain[len(prefix):]
+        path = parsed.path.rstrip("/")
+
+        # youtu.be/ID -> youtube.com/watch?v=ID
+        if domain == "youtu.be" and path:
+            return f"youtube.com/watch?v={path.lstrip('/')}"
+
+        query = [
+            (k, v) for k, v in parse_qsl(parsed.query)
+            if k not in TRACKING_PARAMS and not k.startswith("utm_")
+        ]
+        key = f"{domain}{path}"
+        if query:
+            key += "?" + urlencode(sorted(query))
+        return key
+
+    def make_token(self, url: str) -> str:
+        """معرف قصير للرابط (يصلح لروابط /start)"""
+        return hashlib.sha1(self.make_key(url).encode()).hexdigest()[:16]
+
+    def get(self, namespace: str, url: str):
+        """البحث عن ملف محفوظ"""
+        bucket = self.entries.get(namespace)
+        entry = bucket.get(self.make_key(url)) if bucket else None
+        CACHE_LOOKUPS.inc(namespace, "hit" if entry else "miss")
+        return entry
+
+    def find(self, namespaces, url: str):
+        """أول ملف محفوظ في أي من namespaces بالترتيب: (namespace, entry)"""
+        for namespace in namespaces:
+            entry = self.get(namespace, url)
+            if entry:
+                return namespace, entry
+        return None, None
+
+    def evict(self, namespace: str, url: str):
+        """حذف file_id لم يعد Telegram يقبله"""
+        bucket = self.entries.get(namespace)
+        if bucket and bucket.pop(self.make_key(url), None):
+            self.dirty = True
+
+    def put(self, namespace: str, url: str, file_id: str, **meta):
+        """حفظ file_id بعد الإرسال"""
+        bucket = self.entries.setdefault(namespace, {})
+        key = self.make_key(url)
+        bucket.pop(key, None)
+        bucket[key] = {"file_id": file_id, "cached_at": int(time.time()), **meta}
+
+        # حذف الأقدم عند تجاوز الحد
+        while len(bucket) > CACHE_MAX_ENTRIES:
+            bucket.pop(next(iter(bucket)))
+
+        self.dirty = True
+
+
+class NegativeCache:
+    """
+    كاش للروابط الفاشلة (محذوف، خاص، محجوب...) حتى لا ندفع مهلة الاستخراج مرة أخرى.
+    في الذاكرة فقط، ومدة الصلاحية حسب نوع الخطأ.
+    أخطاء الرابط نفسه مشتركة بين الفيديو والصوت، وباقي الأخطاء لكل نوع تحميل (وجودة) وحده.
+    """
+
+    # أخطاء لا تتعلق بالصيغة المطلوبة: فشل الفيديو = فشل الصوت
+    URL_ERRORS = {"unavailable", "private", "copyright", "age_restricted", "login_required", "geo_blocked"}
+
+    def __init__(self, ttls: dict = NEGATIVE_CACHE_TTLS, max_entries: int = NEGATIVE_CACHE_MAX_ENTRIES):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def _keys(url: str, kind: str):
+        """مفتاح أخطاء الرابط، ومفتاح نوع التحميل (video / video720 / audio ...)"""
+        key = FileCache.make_key(url)
+        return key, f"{kind}:{key}"
+
+    def _lookup(self, key: str):
+        entry = self.entries.get(key)
+        if entry and entry["expires"] <= time.time():
+            del self.entries[key]
+            entry = None
+        return entry
+
+    def get(self, url: str, kind: str = "video"):
+        """إرجاع الخطأ المحفوظ إذا كان ما زال صالحاً"""
+        url_key, kind_key = self._keys(url, kind)
+        entry = self._lookup(url_key) or self._lookup(kind_key)
+        CACHE_LOOKUPS.inc("negative", "hit" if entry else "miss")
+        if not entry:
+            return None
+        NEGATIVE_CACHE_HITS.inc(entry["error_class"])
+        return {"success": False, "error_class": entry["error_class"], "error": entry["error"], "negative_cached": True}
+
+    def put(self, url: str, result: dict, kind: str = "video"):
+        """حفظ نتيجة فاشلة (فقط الأنواع التي لها مدة في NEGATIVE_CACHE_TTLS)"""
+        ttl = self.ttls.get(result.get("error_class"))
+        if not ttl:
+            return
+        url_key, kind_key = self._keys(url, kind)
+        key = url_key if result["error_class"] in self.URL_ERRORS else kind_key
+        self.entries.pop(key, None)
+        self.entries[key] = {
+            "error_class": result["error_class"],
+            "error": result.get("error", ""),
+            "expires": time.time() + ttl,
+        }
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
@@ -101,6 +101,10 @@ SUPPORTED_PLATFORMS = [
     "twitch.tv", "clips.twitch.tv",
     # Snapchat
     "snapchat.com",
+    # SoundCloud
+    "soundcloud.com",
+    # Telegram
+    "t.me", "telegram.me",
 ]
 
 # ðŸŽ¨ Ø¥Ø¹Ø¯Ø§Ø¯Ø§Øª Bot
@@ -114,8 +118,156 @@ FORCE_CHANNEL_URL = "https://t.me/YourChannel"
 # ðŸ”’ Ø¥Ø¹Ø¯Ø§Ø¯Ø§Øª Ø§Ù„Ø£Ù…Ø§Ù†
 RATE_LIMIT_ENABLED = True
 MAX_REQUESTS_PER_MINUTE = 10
+RATE_LIMIT_SECONDS = 3  # أقل مدة بين طلبين لنفس المستخدم
 
 # ðŸ“¦ Ø¥Ø¹Ø¯Ø§Ø¯Ø§Øª Ø§Ù„ØªØ­Ù…ÙŠÙ„
 MAX_FILE_SIZE_MB = 50
 DOWNLOAD_TIMEOUT = 300
 
+# ✂️ تقسيم الفيديوهات الكبيرة إلى أجزاء (يحتاج ffmpeg)
+SPLIT_LARGE_VIDEOS = True
+MAX_SPLIT_PARTS = 20  # أقصى عدد للأجزاء لكل فيديو
+SPLIT_SIZE_MARGIN = 0.92  # نسبة الأمان من MAX_FILE_SIZE_MB لكل جزء
+
+# 🎵 وضع الصوت فقط (/audio)
+AUDIO_FORMAT = "m4a"  # m4a أو mp3
+AUDIO_QUALITY = "192"  # kbps عند التحويل إلى mp3
+
+# 🗂️ كاش file_id (إعادة الإرسال بدون تحميل)
+CACHE_FILE = "file_cache.json"
+CACHE_MAX_ENTRIES = 5000  # لكل namespace
+CACHE_SAVE_INTERVAL_SECONDS = 10  # تجميع التعديلات في كتابة واحدة
+
+# 📚 وضع الدفعات (عدة روابط / قوائم تشغيل)
+BATCH_MAX_LINKS = 10  # أقصى عدد روابط في رسالة واحدة
+PLAYLIST_MAX_ITEMS = 10  # أقصى عدد عناصر عند توسيع قائمة التشغيل (/playlist)
+MAX_PARALLEL_DOWNLOADS_PER_USER = 3
+
+# ⚡ إعدادات سرعة التحميل لكل منصة (HLS/DASH)
+# concurrent_fragments: عدد الأجزاء التي تُحمّل بالتوازي
+# http_chunk_size: حجم كل طلب HTTP بالبايت (None = طلب واحد)
+# external_downloader: برنامج تحميل خارجي للروابط المباشرة (مثلاً "aria2c")، None = تحميل yt-dlp الداخلي
+# external_downloader_args: خيارات هذا البرنامج فقط (مثلاً aria2c: ["-x", "8", "-s", "8", "-k", "1M"])
+PLATFORM_DOWNLOAD_PROFILES = {
+    "default": {"concurrent_fragments": 4, "http_chunk_size": None, "external_downloader": None, "external_downloader_args": []},
+    "youtube": {"concurrent_fragments": 8, "http_chunk_size": 10 * 1024 * 1024},
+    "twitch": {"concurrent_fragments": 8, "http_chunk_size": None},
+    "reddit": {"concurrent_fragments": 6, "http_chunk_size": None},
+    "vimeo": {"concurrent_fragments": 8, "http_chunk_size": None},
+    "dailymotion": {"concurrent_fragments": 6, "http_chunk_size": None},
+    "tiktok": {"concurrent_fragments": 1, "http_chunk_size": None},
+    "instagram": {"concurrent_fragments": 4, "http_chunk_size": None},
+    "twitter": {"concurrent_fragments": 4, "http_chunk_size": None},
+}
+
+# 🚦 حدود السرعة والقرص
+TOTAL_DOWNLOAD_BANDWIDTH_MBPS = None  # السرعة الكلية للتحميل (Mbps)، None = بدون حد
+MIN_FREE_DISK_MB = 500  # أقل مساحة حرة مسموحة في مجلد التحميلات
+JOB_DISK_RESERVATION_MB = 100  # المساحة المحجوزة مسبقاً لكل تحميل
+ADMISSION_WAIT_SECONDS = 60  # مدة الانتظار في الطابور قبل الرفض
+
+# 📈 مقاييس Prometheus (http://HOST:PORT/metrics)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# 🧾 سجل الطلبات (سطر JSON لكل طلب)
+REQUEST_LOG_FILE = "logs/requests.jsonl"
+REQUEST_LOG_MAX_BYTES = 20 * 1024 * 1024  # تدوير الملف عند هذا الحجم
+REQUEST_LOG_BACKUPS = 5
+REQUEST_LOG_FLUSH_SECONDS = 2
+REQUEST_LOG_SALT = "change-me"  # لإخفاء هوية المستخدمين
+
+# 🔬 تتبع الطلبات البطيئة (يمكن تفعيله من البوت بالأمر /profile)
+PROFILING_ENABLED = False
+PROFILE_SLOW_SECONDS = 20  # حفظ تقرير لأي طلب أبطأ من هذا
+PROFILE_KEEP = 10  # عدد التقارير المحفوظة في الذاكرة
+PROFILE_TOP_FUNCTIONS = 30  # عدد الدوال في تقرير cProfile
+
+# 🚀 البدء السريع
+WARMUP_DELAY_SECONDS = 2  # تأخير استيراد yt-dlp في الخلفية بعد بدء البوت
+CLEANUP_INTERVAL_MINUTES = 30  # تنظيف مجلد التحميلات دورياً
+
+# 🚫 كاش الروابط الفاشلة: مدة الصلاحية (ثواني) لكل نوع خطأ
+# الأنواع غير الموجودة هنا لا تُحفظ (مثلاً busy و too_large)
+NEGATIVE_CACHE_TTLS = {
+    "unavailable": 24 * 3600,
+    "private": 12 * 3600,
+    "copyright": 24 * 3600,
+    "age_restricted": 12 * 3600,
+    "login_required": 6 * 3600,
+    "geo_blocked": 3600,
+    "extract_failed": 600,
+    "missing_file": 300,
+    # timeout و network_error غير موجودة: إعادة الطلب تستكمل الملف الجزئي
+    "download_error": 120,
+    "exception": 60,
+}
+NEGATIVE_CACHE_MAX_ENTRIES = 10000
+
+# 🩺 صحة المنصات (Circuit Breaker)
+HEALTH_WINDOW = 20  # عدد آخر الطلبات المحسوبة لكل منصة
+HEALTH_MIN_REQUESTS = 5  # أقل عدد طلبات قبل الحكم على المنصة
+HEALTH_FAILURE_RATE = 0.6  # فتح الـ breaker عند هذه النسبة من الفشل
+BREAKER_OPEN_SECONDS = 60  # مدة الانتظار قبل الطلب التجريبي
+BREAKER_MAX_OPEN_SECONDS = 15 * 60  # أقصى مدة (تتضاعف مع كل تجربة فاشلة)
+BREAKER_FALLBACK_TIMEOUT = 60  # مهلة التحميل بالإعدادات البديلة
+# إعدادات بديلة أخف أثناء تعطل المنصة (المنصات غير الموجودة هنا تُرفض فوراً)
+BREAKER_FALLBACK_PROFILES = {
+    # بدون api_hostname الثابت: yt-dlp يستخدم الخادم الافتراضي
+    "tiktok": {"extractor_args": {}, "retries": 1, "fragment_retries": 1, "socket_timeout": 10},
+    "instagram": {"retries": 1, "fragment_retries": 1, "socket_timeout": 10},
+    "twitter": {"retries": 1, "fragment_retries": 1, "socket_timeout": 10},
+}
+
+# 📤 حدود إرسال الرسائل (حسب حدود Bot API)
+SEND_GLOBAL_RATE = 30  # رسالة/ثانية للبوت كله
+SEND_CHAT_RATE = 1.0  # رسالة/ثانية لكل محادثة خاصة
+SEND_CHAT_BURST = 3  # رسائل متتالية مسموحة قبل التقييد
+SEND_GROUP_RATE_PER_MINUTE = 20  # لكل مجموعة
+SEND_MAX_RETRIES = 3  # إعادة المحاولة بعد RetryAfter
+
+# 📢 الرسائل الجماعية (/broadcast)
+BROADCAST_STATE_FILE = "broadcast_state.json"  # لاستكمال الإرسال بعد إعادة التشغيل
+BROADCAST_BATCH_SIZE = 100  # عدد المستخدمين في كل دفعة (نقطة حفظ بعد كل دفعة)
+BROADCAST_PAGE_SIZE = 1000  # عدد المعرفات المقروءة من المستخدمين في كل مرة (بدل القائمة كاملة)
+BROADCAST_RATE = 25  # رسالة/ثانية (أقل من الحد الكلي لترك مجال لباقي الرسائل)
+BROADCAST_REPORT_SECONDS = 5  # تحديث رسالة التقدم للمشرف
+
+# ⏯️ استكمال التحميلات المنقطعة
+PARTIAL_RETENTION_MINUTES = 30  # مدة الاحتفاظ بالملفات الجزئية (.part) لاستكمالها
+DOWNLOAD_RESUME_ATTEMPTS = 2  # إعادة المحاولة تلقائياً بعد خطأ شبكة
+DOWNLOAD_RESUME_BACKOFF_SECONDS = 2
+
+# ⚖️ توزيع أماكن التحميل بين المستخدمين (Weighted Fair Queuing)
+DOWNLOAD_SLOTS = 4  # عدد التحميلات المتزامنة
+MAX_CONCURRENT_UPDATES = 64  # عدد الرسائل التي يعالجها البوت في نفس الوقت
+# الوزن حسب مستوى المستخدم (get_user_level): الأعلى يتقدم أسرع في الطابور
+TIER_WEIGHTS = {"Bronze": 1, "Silver": 2, "Gold": 3, "Diamond": 4}
+# تكلفة الطلب = مدة الفيديو بالثواني (الفيديو القصير يتقدم على الطويل)
+FAIR_DEFAULT_DURATION = 180  # عند عدم معرفة المدة
+FAIR_MIN_COST_SECONDS = 15
+FAIR_MAX_COST_SECONDS = 1200  # سقف التكلفة: الفيديو الطويل جداً لا ينتظر للأبد
+METADATA_PROBE_TIMEOUT = 20  # فحص البيانات قبل الطابور (نتيجته تُستخدم في التحميل)
+
+# 🧠 الفيديوهات الصغيرة تُحمّل في الذاكرة (tmpfs) بدل القرص
+MEMORY_DOWNLOAD_DIR = "/dev/shm/video-downloader"  # None = تعطيل (الكل على القرص)
+MEMORY_FILE_MAX_MB = 20  # الفيديو الأكبر من هذا يُحمّل على القرص
+MEMORY_BUDGET_MB = 256  # أقصى مساحة لكل الملفات في الذاكرة معاً
+MEMORY_ESTIMATE_KBPS = 2500  # لتقدير الحجم من المدة عندما لا تعطي المنصة الحجم
+
+# 🔎 وضع المعاينة: معلومات الفيديو وأزرار الجودة قبل التحميل
+PREVIEW_FIRST_ENABLED = False  # True = لا يبدأ التحميل إلا بعد اختيار الجودة
+PREVIEW_TTL_SECONDS = 600  # مدة صلاحية أزرار المعاينة
+PREVIEW_MAX_PENDING = 200  # أقصى عدد معاينات محفوظة (الأقدم يُحذف أولاً)
+
+# ♻️ إعدادات تُعدّل أثناء التشغيل (settings.py)
+# ملف JSON يستبدل: ads_enabled, ads, max_ads_per_user_daily, supported_platforms,
+# max_file_size_mb, rate_limit_seconds, platform_download_profiles
+SETTINGS_FILE = "settings.json"  # غير موجود = القيم أعلاه
+SETTINGS_POLL_SECONDS = 5  # كل كم ثانية يُفحص الملف
+
+# 🛑 الإيقاف الآمن (lifecycle.py)
+SHUTDOWN_DRAIN_SECONDS = 25  # مهلة إنهاء التحميل والرفع الجاري قبل قطعه (أقل من مهلة SIGKILL)
+PENDING_JOBS_FILE = "pending_jobs.json"  # الطلبات المؤجلة تُعاد عند التشغيل التالي
+PENDING_JOBS_MAX_AGE_MINUTES = 30  # الطلبات الأقدم لا تُعاد
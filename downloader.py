@@ -3,58 +3,157 @@
 
 import os
 import re
+import copy
 import asyncio
 import time
+import threading
+import importlib.util
+from contextlib import asynccontextmanager
 from urllib.parse import urlparse
-from config import SUPPORTED_PLATFORMS, MAX_FILE_SIZE_MB, DOWNLOAD_TIMEOUT
+from governor import DownloadGovernor, MemoryBudget, MB
+from scheduler import FairScheduler, SchedulerClosed, job_cost
+from profiler import profiler
+from cache import FileCache, NegativeCache
+from health import PlatformHealth
+from settings import settings
+from lifecycle import defer_current_job
+from metrics import STAGE_SECONDS, BYTES_DOWNLOADED, DOWNLOAD_ERRORS, DOWNLOAD_RETRIES, QUEUE_DEPTH, IN_FLIGHT, DOWNLOAD_STORAGE, MEMORY_USED
+import shutil
+from config import (
+    DOWNLOAD_TIMEOUT, SPLIT_LARGE_VIDEOS, AUDIO_FORMAT, AUDIO_QUALITY,
+    CLEANUP_INTERVAL_MINUTES,
+    BREAKER_FALLBACK_TIMEOUT, PARTIAL_RETENTION_MINUTES,
+    DOWNLOAD_RESUME_ATTEMPTS, DOWNLOAD_RESUME_BACKOFF_SECONDS, METADATA_PROBE_TIMEOUT,
+    MEMORY_DOWNLOAD_DIR, MEMORY_FILE_MAX_MB, MEMORY_BUDGET_MB, MEMORY_ESTIMATE_KBPS
+)
 
-# محاولة استيراد yt-dlp
-try:
-    import yt_dlp
-    YT_DLP_AVAILABLE = True
-except ImportError:
-    YT_DLP_AVAILABLE = False
+# yt-dlp ثقيل (مئات الـ ms وعشرات الـ MB)، لذلك لا يُستورد عند البدء:
+# يتم تحميله في الخلفية بعد أول polling أو عند أول تحميل
+yt_dlp = None
+YT_DLP_AVAILABLE = importlib.util.find_spec("yt_dlp") is not None
+if not YT_DLP_AVAILABLE:
     print("⚠️ yt-dlp غير مثبت. قم بتثبيته: pip install yt-dlp")
 
 
+def load_yt_dlp():
+    """استيراد yt-dlp مرة واحدة (آمن من أي thread)"""
+    global yt_dlp
+    if yt_dlp is None:
+        import yt_dlp as module
+        yt_dlp = module
+    return yt_dlp
+
+# ffmpeg مطلوب لتحويل الصوت
+FFMPEG_AVAILABLE = shutil.which("ffmpeg") is not None
+
+# أخطاء شبكة مؤقتة: إعادة المحاولة تستكمل الملف الجزئي
+NETWORK_ERROR_MARKERS = (
+    "timed out", "connection", "reset by peer", "incompleteread", "incomplete read",
+    "temporary failure", "http error 5", "remote end closed", "bytes read",
+    "bytes, expected", "got error", "network is unreachable", "eof occurred",
+)
+
+# ملفات التحميل غير المكتمل (yt-dlp)
+PARTIAL_SUFFIXES = (".part", ".ytdl")
+
+
+def is_partial_file(filename: str) -> bool:
+    return filename.endswith(PARTIAL_SUFFIXES) or ".part-Frag" in filename
+
+
+class DownloadAborted(Exception):
+    """إيقاف thread التحميل بعد انتهاء المهلة"""
+
+
+class MemoryLimitExceeded(Exception):
+    """الفيديو أكبر من حد الذاكرة: يُعاد تحميله على القرص"""
+
+
+# خيارات الجودة في وضع المعاينة (أقصى ارتفاع)
+QUALITY_HEIGHTS = {"360": 360, "720": 720}
+
+# نمط واحد مُجمّع مسبقاً لكل الروابط
+URL_PATTERN = re.compile(r'(?:https?://|www\.)[^\s<>"{}|\\^`\[\]]+')
+
+
 class VideoDownloader:
     def __init__(self):
         self.download_dir = "downloads"
         os.makedirs(self.download_dir, exist_ok=True)
-        self.cleanup_old_files()  # تنظيف عند البدء
+        self.governor = DownloadGovernor(self.download_dir)
+        # الفيديوهات الصغيرة في الذاكرة (tmpfs) بدل القرص
+        self.memory = MemoryBudget(MEMORY_DOWNLOAD_DIR, MEMORY_BUDGET_MB)
+        # أماكن التحميل موزعة بعدل بين المستخدمين
+        self.scheduler = FairScheduler()
+        self.negative_cache = NegativeCache()
+        self.health = PlatformHealth()
+        # (user_id, kind, key) -> [lock, عدد المنتظرين]
+        self._file_locks = {}
+        QUEUE_DEPTH.set_function(lambda: self.scheduler.waiting + self.governor.waiting)
+        IN_FLIGHT.set_function(lambda: len(self.governor.jobs))
+        MEMORY_USED.set_function(lambda: self.memory.used_bytes() if self.memory.enabled else 0)
+    
+    async def maintenance_loop(self, warmup_delay: float = 0):
+        """
+        مهمة خلفية: استيراد yt-dlp ثم تنظيف المجلد دورياً
+        (كلاهما داخل thread حتى لا يتأخر أول polling)
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(warmup_delay)
+        if YT_DLP_AVAILABLE:
+            started = time.perf_counter()
+            await loop.run_in_executor(None, load_yt_dlp)
+            print(f"yt-dlp loaded in {time.perf_counter() - started:.2f}s")
+        while True:
+            await loop.run_in_executor(None, self.cleanup_old_files)
+            await asyncio.sleep(CLEANUP_INTERVAL_MINUTES * 60)
     
     def is_supported_url(self, url: str) -> bool:
         """التحقق من أن الرابط مدعوم"""
-        try:
-            parsed = urlparse(url)
-            domain = parsed.netloc.lower().replace("www.", "")
-            
-            for platform in SUPPORTED_PLATFORMS:
-                if platform in domain:
-                    return True
-            return False
-        except:
-            return False
+        return settings.current.is_supported(url)
     
     def extract_url(self, text: str) -> str:
         """استخراج الرابط من النص"""
-        # أنماط متعددة للروابط
-        patterns = [
-            r'https?://[^\s<>"{}|\\^`\[\]]+',
-            r'www\.[^\s<>"{}|\\^`\[\]]+',
-        ]
+        urls = self.extract_urls(text)
+        return urls[0] if urls else None
+    
+    def extract_urls(self, text: str) -> list:
+        """استخراج كل الروابط من النص (بدون تكرار وبنفس الترتيب)"""
+        urls = []
+        for match in URL_PATTERN.finditer(text):
+            url = match.group(0)
+            # إضافة https:// إذا كان يبدأ بـ www
+            if url.startswith('www.'):
+                url = 'https://' + url
+            # تنظيف الرابط
+            url = url.rstrip('.,;:!?')
+            if url not in urls:
+                urls.append(url)
+        return urls
+    
+    def get_platform_key(self, url: str) -> str:
+        """مفتاح المنصة المستخدم في الإعدادات"""
+        domain = urlparse(url).netloc.lower()
         
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                url = match.group(0)
-                # إضافة https:// إذا كان يبدأ بـ www
-                if url.startswith('www.'):
-                    url = 'https://' + url
-                # تنظيف الرابط
-                url = url.rstrip('.,;:!?')
-                return url
-        return None
+        aliases = {
+            "youtube": "youtube", "youtu.be": "youtube",
+            "tiktok": "tiktok",
+            "instagram": "instagram",
+            "twitter": "twitter", "x.com": "twitter",
+            "facebook": "facebook", "fb.watch": "facebook",
+            "reddit": "reddit", "redd.it": "reddit",
+            "vimeo": "vimeo",
+            "dailymotion": "dailymotion", "dai.ly": "dailymotion",
+            "twitch": "twitch",
+            "pinterest": "pinterest",
+            "snapchat": "snapchat",
+        }
+        
+        for key, platform in aliases.items():
+            if key in domain:
+                return platform
+        
+        return "default"
     
     def get_platform_name(self, url: str) -> str:
         """معرفة اسم المنصة مع أيقونة"""
@@ -83,9 +182,14 @@ class VideoDownloader:
         
         return "🌐 Unknown"
     
-    async def download_video(self, url: str, user_id: int) -> dict:
+    @profiler.traced("download_video")
+    async def download_video(self, url: str, user_id: int, weight: float = 1.0,
+                             quality: str = None, info: dict = None) -> dict:
         """
         تحميل الفيديو مع دعم متقدم
+        weight: وزن المستخدم في طابور التحميل (حسب مستواه)
+        quality: "360" أو "720" (None = الصيغة الافتراضية للمنصة)
+        info: نتيجة preview() (لا يتكرر الاستخراج)
         Returns: {"success": bool, "file_path": str, "title": str, "error": str}
         """
         if not YT_DLP_AVAILABLE:
@@ -94,17 +198,199 @@ class VideoDownloader:
                 "error": "yt-dlp غير مثبت"
             }
         
-        # تنظيف الملفات القديمة للمستخدم
-        self._cleanup_user_files(user_id)
+        # نفس الفيديو بنفس الجودة لنفس المستخدم لا يُحمّل مرتين في نفس الوقت (نفس الملف)،
+        # وكل جودة لها ملفها (لا يُستكمل ملف 360p الجزئي بصيغة 720p)
+        kind = f"video{quality or ''}"
+        async with self._file_lock(user_id, kind, url):
+            # ملفات المستخدم المتروكة فقط (طلباته الأخرى قد تكون قيد الرفع أو التقسيم)
+            self._cleanup_user_files(user_id)
+            
+            ydl_opts = self._build_opts(url, self._output_template(user_id, kind), quality)
+            return await self._run_download(url, ydl_opts, SPLIT_LARGE_VIDEOS, user_id, weight, info,
+                                            kind=kind)
+    
+    @profiler.traced("download_audio")
+    async def download_audio(self, url: str, user_id: int, weight: float = 1.0, info: dict = None) -> dict:
+        """
+        تحميل الصوت فقط (m4a/mp3)
+        Returns: {"success": bool, "file_path": str, "title": str, "performer": str, "error": str}
+        """
+        if not YT_DLP_AVAILABLE:
+            return {
+                "success": False,
+                "error": "yt-dlp غير مثبت"
+            }
         
-        timestamp = int(time.time())
-        output_template = os.path.join(
-            self.download_dir,
-            f"{user_id}_{timestamp}_%(title).40s.%(ext)s"
-        )
+        async with self._file_lock(user_id, "audio", url):
+            self._cleanup_user_files(user_id)
+            ydl_opts = self._build_opts(url, self._output_template(user_id, "audio"))
+            return await self._run_download(url, self._audio_opts(ydl_opts), False, user_id, weight, info,
+                                            kind="audio")
+    
+    def _audio_opts(self, ydl_opts: dict) -> dict:
+        """إعدادات استخراج الصوت"""
+        if FFMPEG_AVAILABLE:
+            # أفضل صوت ثم تحويله (أو نسخه مباشرة إذا كان AAC) إلى الصيغة المطلوبة
+            ydl_opts['format'] = 'bestaudio[ext=m4a]/bestaudio/best'
+            ydl_opts['postprocessors'] = [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': AUDIO_FORMAT,
+                'preferredquality': AUDIO_QUALITY,
+            }]
+        else:
+            # بدون ffmpeg: صيغة صوت جاهزة فقط
+            ydl_opts['format'] = 'bestaudio[ext=m4a]/bestaudio[ext=mp3]/bestaudio'
+        return ydl_opts
+    
+    @asynccontextmanager
+    async def _file_lock(self, user_id: int, kind: str, url: str):
+        key = (user_id, kind, FileCache.make_key(url))
+        entry = self._file_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._file_locks.pop(key, None)
+    
+    async def expand_playlist(self, url: str, limit: int) -> list:
+        """استخراج روابط عناصر قائمة التشغيل (بدون تحميل)"""
+        if not YT_DLP_AVAILABLE:
+            return []
+        
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+            'playlistend': limit,
+            'socket_timeout': 30,
+        }
+        
+        def _expand():
+            with load_yt_dlp().YoutubeDL(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+            if not info:
+                return []
+            entries = info.get('entries')
+            if entries is None:
+                return [url]
+            urls = []
+            for entry in entries:
+                if not entry:
+                    continue
+                entry_url = entry.get('webpage_url') or entry.get('url')
+                if entry_url and entry_url.startswith('http'):
+                    urls.append(entry_url)
+                if len(urls) >= limit:
+                    break
+            return urls
+        
+        try:
+            loop = asyncio.get_event_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(None, _expand),
+                timeout=DOWNLOAD_TIMEOUT
+            )
+        except Exception as e:
+            print(f"Error expanding playlist: {e}")
+            return []
+    
+    async def preview(self, url: str) -> dict:
+        """
+        استخراج البيانات فقط (بدون تحميل) لعرض خيارات الجودة
+        Returns: {"success": bool, "info": dict, "title", "duration", "thumbnail", "sizes": {quality: bytes}}
+        """
+        if not YT_DLP_AVAILABLE:
+            return {"success": False, "error": "yt-dlp غير مثبت"}
+        
+        cached = self.negative_cache.get(url, "preview")
+        if cached:
+            return cached
+        
+        timings = {}
+        info, error = await self._probe(url, self._build_opts(url, ""), timings, METADATA_PROBE_TIMEOUT)
+        if error:
+            self.negative_cache.put(url, error, "preview")
+            return error
+        if not info:
+            return {"success": False, "error_class": "extract_failed", "error": "فشل في استخراج معلومات الفيديو"}
+        
+        return {
+            "success": True,
+            "info": self.slim_info(info),
+            "title": re.sub(r'[<>:"/\\|?*]', '', info.get('title') or 'video')[:100],
+            "duration": info.get('duration') or 0,
+            "thumbnail": info.get('thumbnail'),
+            "sizes": self.estimate_quality_sizes(info),
+            "timings": timings,
+        }
+    
+    # بيانات للعرض فقط، غير لازمة للتحميل وقد تكون كبيرة جداً (ترجمات YouTube)
+    DISPLAY_ONLY_KEYS = (
+        'automatic_captions', 'subtitles', 'heatmap', 'description', 'thumbnails',
+        'tags', 'categories', 'chapters', 'comments',
+    )
+    
+    @classmethod
+    def slim_info(cls, info: dict) -> dict:
+        """
+        ما يلزم download_video(info=...) فقط (المعاينة تبقى في الذاكرة حتى اختيار الجودة)
+        الصيغ بدون صوت ولا صورة (storyboards) لا تختارها أي جودة
+        """
+        for key in cls.DISPLAY_ONLY_KEYS:
+            info.pop(key, None)
+        if info.get('formats'):
+            info['formats'] = [
+                f for f in info['formats']
+                if not (f.get('vcodec') == 'none' and f.get('acodec') == 'none')
+            ]
+        return info
+    
+    @staticmethod
+    def estimate_quality_sizes(info: dict) -> dict:
+        """الحجم التقريبي لكل جودة من قائمة الصيغ (None = غير معروف)"""
+        duration = info.get('duration')
         
-        max_size = MAX_FILE_SIZE_MB * 1024 * 1024  # تحويل إلى bytes
+        def size_of(f):
+            size = f.get('filesize') or f.get('filesize_approx')
+            if not size and f.get('tbr') and duration:
+                size = f['tbr'] * duration * 125
+            return size
         
+        formats = info.get('formats') or []
+        # صيغ كاملة (فيديو + صوت) لا تحتاج دمج بـ ffmpeg
+        complete = [
+            f for f in formats
+            if f.get('vcodec') not in (None, 'none') and f.get('acodec') not in (None, 'none') and f.get('height')
+        ]
+        sizes = {}
+        for quality, height in QUALITY_HEIGHTS.items():
+            candidates = [f for f in complete if f['height'] <= height]
+            best = max(candidates, key=lambda f: (f['height'], f.get('tbr') or 0), default=None)
+            sizes[quality] = size_of(best) if best else None
+        audio = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')]
+        best_audio = max(audio, key=lambda f: f.get('abr') or f.get('tbr') or 0, default=None)
+        sizes["audio"] = size_of(best_audio) if best_audio else None
+        # صيغة واحدة بدون قائمة (TikTok وغيرها): نفس الحجم لكل جودة فيديو
+        if not formats:
+            single = size_of(info)
+            sizes.update({quality: single for quality in QUALITY_HEIGHTS})
+        return sizes
+    
+    def _output_template(self, user_id: int, kind: str) -> str:
+        """
+        مسار ثابت لكل (مستخدم، فيديو): إعادة المحاولة تجد نفس الملف الجزئي
+        (.part / .ytdl) فيستكمل yt-dlp التحميل بدل البدء من الصفر
+        """
+        return os.path.join(
+            self.download_dir,
+            f"{user_id}_{kind}_%(extractor_key)s_%(id).60s.%(ext)s"
+        )
+    
+    def _build_opts(self, url: str, output_template: str, quality: str = None) -> dict:
+        """إعدادات yt-dlp حسب المنصة (quality: حد أقصى للارتفاع فوق صيغة المنصة)"""
         ydl_opts = {
             # استخدام format يتجنب الحاجة لـ ffmpeg - فيديو واحد بدون دمج
             'format': 'best[ext=mp4][vcodec!*=av01]/best[ext=mp4]/best[vcodec!*=av01]/best',
@@ -116,6 +402,8 @@ class VideoDownloader:
             'socket_timeout': 30,
             'retries': 3,
             'fragment_retries': 3,
+            # استكمال الملفات الجزئية (HTTP Range و أجزاء HLS/DASH)
+            'continuedl': True,
             # منع أي عملية تحتاج ffmpeg
             'postprocessors': [],
             'prefer_free_formats': False,
@@ -157,94 +445,379 @@ class VideoDownloader:
         elif 'twitter' in domain or 'x.com' in domain:
             ydl_opts['format'] = 'best'
         
+        # الجودة المختارة من المعاينة: نفس اختيارات المنصة مع حد للارتفاع،
+        # ثم اختيارات المنصة كما هي إذا لم تتوفر صيغة بهذا الارتفاع
+        height = QUALITY_HEIGHTS.get(quality)
+        if height:
+            capped = [f"{choice}[height<={height}]" for choice in ydl_opts['format'].split('/') if not choice.isdigit()]
+            ydl_opts['format'] = '/'.join(capped + [ydl_opts['format']])
+        
+        # تحميل أجزاء HLS/DASH بالتوازي
+        profile = settings.current.download_profile(self.get_platform_key(url))
+        ydl_opts['concurrent_fragment_downloads'] = profile.get("concurrent_fragments", 1)
+        if profile.get("http_chunk_size"):
+            ydl_opts['http_chunk_size'] = profile["http_chunk_size"]
+        
+        # برنامج تحميل خارجي للروابط المباشرة فقط (HLS يبقى داخلياً)
+        tool = profile.get("external_downloader")
+        if tool and shutil.which(tool):
+            ydl_opts['external_downloader'] = {'http': tool}
+            if profile.get("external_downloader_args"):
+                ydl_opts['external_downloader_args'] = {tool: profile["external_downloader_args"]}
+        
+        return ydl_opts
+    
+    async def _probe(self, url: str, ydl_opts: dict, timings: dict, timeout: float):
+        """
+        فحص بيانات الفيديو قبل الطابور (بدون معالجة الصيغ أو تحميل)
+        Returns: (info أو None، نتيجة خطأ أو None)
+        النتيجة تُعاد استخدامها في التحميل، فلا يتكرر طلب الاستخراج
+        """
+        def _extract():
+            load_yt_dlp()
+            with yt_dlp.YoutubeDL(dict(ydl_opts)) as ydl:
+                return ydl.extract_info(url, download=False, process=False)
+        
+        started = time.perf_counter()
         try:
-            # تشغيل التحميل مع timeout
             loop = asyncio.get_event_loop()
-            result = await asyncio.wait_for(
-                loop.run_in_executor(
-                    None,
-                    lambda: self._download_sync(url, ydl_opts)
-                ),
-                timeout=DOWNLOAD_TIMEOUT
+            info = await asyncio.wait_for(
+                loop.run_in_executor(None, profiler.bind(_extract)),
+                timeout=timeout
             )
-            return result
-            
+            return info, None
         except asyncio.TimeoutError:
+            # التحميل يعيد المحاولة بنفسه
+            return None, None
+        except Exception as e:
+            if yt_dlp is not None and isinstance(e, yt_dlp.utils.DownloadError):
+                error = self._classify_error(e)
+                # أخطاء الشبكة تُترك لحلقة الاستكمال
+                if error['error_class'] != "network_error":
+                    return None, error
+            return None, None
+        finally:
+            timings["probe"] = time.perf_counter() - started
+            STAGE_SECONDS.observe(timings["probe"], "probe")
+    
+    async def _run_download(self, url: str, ydl_opts: dict, keep_oversized: bool, user_id: int = 0,
+                            weight: float = 1.0, info: dict = None, kind: str = "video") -> dict:
+        """
+        تشغيل التحميل في thread مع timeout
+        kind: نوع التحميل (video / video720 / audio) لمفتاح كاش الأخطاء
+        """
+        timings = {}
+        
+        # رابط فشل مؤخراً: نفس الخطأ فوراً بدون استخراج
+        cached = self.negative_cache.get(url, kind)
+        if cached:
+            cached['timings'] = timings
+            return cached
+        
+        # البوت يتوقف: الرابط يُحفظ ويُحمّل بعد إعادة التشغيل
+        if self.scheduler.closed:
+            return self._deferred(url, timings)
+        
+        # المنصة معطلة: رفض فوري أو إعدادات بديلة أخف
+        platform = self.get_platform_key(url)
+        mode = self.health.admit(platform)
+        if mode == "reject":
+            DOWNLOAD_ERRORS.inc(platform, "platform_down")
             return {
                 "success": False,
-                "error": "انتهت مهلة التحميل. جرب فيديو أقصر."
+                "error_class": "platform_down",
+                "error": "المنصة لا تستجيب حالياً. حاول بعد قليل.",
+                "timings": timings
             }
-        except Exception as e:
-            return {
+        timeout = DOWNLOAD_TIMEOUT
+        if mode == "fallback":
+            self.health.apply_fallback(platform, ydl_opts)
+            timeout = BREAKER_FALLBACK_TIMEOUT
+        
+        result = {"success": False, "error_class": "cancelled"}
+        started = time.perf_counter()
+        try:
+            # مدة الفيديو تحدد مكانه في الطابور (المعاينة تكون قد فحصته مسبقاً)
+            error = None
+            if info is None:
+                info, error = await self._probe(url, ydl_opts, timings, min(METADATA_PROBE_TIMEOUT, timeout))
+            cost = job_cost(info.get('duration') if info else None)
+            estimate = self._estimate_size(info)
+            use_memory = estimate is not None and estimate <= MEMORY_FILE_MAX_MB * MB
+            attempt = 0
+            while True:
+                if error:
+                    result = error
+                    break
+                # نسخة لكل محاولة (الـ hooks الخاصة بالمحاولة السابقة لا تتراكم)
+                attempt_opts = dict(ydl_opts, progress_hooks=list(ydl_opts.get('progress_hooks', [])))
+                # انتظار الدور (المكان يُحرر بين المحاولات)
+                try:
+                    waited = await self.scheduler.acquire(user_id, weight, cost)
+                except SchedulerClosed:
+                    result = self._deferred(url, timings)
+                    break
+                timings["queue_wait"] = timings.get("queue_wait", 0) + waited
+                STAGE_SECONDS.observe(waited, "queue_wait")
+                reservation = self._reserve_memory(attempt_opts, estimate) if use_memory else None
+                try:
+                    result = await self._admit_and_download(
+                        url, attempt_opts, keep_oversized, timings, timeout, copy.deepcopy(info)
+                    )
+                finally:
+                    if reservation is not None:
+                        self.memory.release(reservation)
+                    self.scheduler.release()
+                result['storage'] = "memory" if reservation is not None else "disk"
+                
+                if result.get('error_class') == "memory_overflow":
+                    # أكبر من التقدير: إعادة التحميل على القرص (لا تُحسب كمحاولة)
+                    DOWNLOAD_STORAGE.inc("overflow")
+                    use_memory = False
+                    continue
+                if result.get('error_class') != "network_error" or attempt == DOWNLOAD_RESUME_ATTEMPTS:
+                    break
+                # نفس مسار الملف: yt-dlp يستكمل من حيث توقف
+                attempt += 1
+                DOWNLOAD_RETRIES.inc(platform)
+                print(f"Network error, resuming download ({attempt}/{DOWNLOAD_RESUME_ATTEMPTS}): {url}")
+                await asyncio.sleep(DOWNLOAD_RESUME_BACKOFF_SECONDS * attempt)
+        finally:
+            self.health.record(platform, mode, result, time.perf_counter() - started)
+        
+        result['timings'] = timings
+        if result.get('file_size'):
+            BYTES_DOWNLOADED.inc(platform, amount=result['file_size'])
+        if result['success']:
+            DOWNLOAD_STORAGE.inc(result['storage'])
+        if not result['success']:
+            DOWNLOAD_ERRORS.inc(platform, result.get('error_class', 'other'))
+            self.negative_cache.put(url, result, kind)
+        return result
+    
+    @staticmethod
+    def _deferred(url: str, timings: dict) -> dict:
+        """نتيجة طلب لم يبدأ قبل إيقاف البوت"""
+        defer_current_job(url)
+        return {
+            "success": False,
+            "error_class": "shutdown",
+            "error": "البوت يُعاد تشغيله، سيتم تحميل الرابط تلقائياً بعد قليل.",
+            "timings": timings
+        }
+    
+    @staticmethod
+    def _estimate_size(info: dict):
+        """تقدير حجم الملف من نتيجة الفحص (None = غير معروف)"""
+        if not info:
+            return None
+        size = info.get('filesize') or info.get('filesize_approx')
+        if size:
+            return size
+        duration = info.get('duration')
+        # الصيغة النهائية لم تُختر بعد: أكبر صيغة (تقدير متحفظ)
+        sizes = [
+            f.get('filesize') or f.get('filesize_approx') or (f['tbr'] * duration * 125 if f.get('tbr') and duration else 0)
+            for f in info.get('formats') or []
+        ]
+        sizes = [s for s in sizes if s]
+        if sizes:
+            return int(max(sizes))
+        if duration:
+            return int(duration * MEMORY_ESTIMATE_KBPS * 125)
+        return None
+    
+    def _reserve_memory(self, ydl_opts: dict, estimate: int):
+        """
+        نقل التحميل إلى الذاكرة إذا سمحت الميزانية
+        Returns: رقم الحجز أو None (يبقى على القرص)
+        """
+        reservation = self.memory.reserve(estimate)
+        if reservation is None:
+            return None
+        ydl_opts['outtmpl'] = os.path.join(self.memory.path, os.path.basename(ydl_opts['outtmpl']))
+        limit = MEMORY_FILE_MAX_MB * MB
+        
+        def limit_hook(d):
+            if d.get('status') != 'downloading':
+                return
+            if max(d.get('downloaded_bytes') or 0, d.get('total_bytes') or 0) > limit:
+                raise MemoryLimitExceeded(d.get('tmpfilename') or d.get('filename'))
+        ydl_opts['progress_hooks'].append(limit_hook)
+        return reservation
+    
+    async def _admit_and_download(self, url: str, ydl_opts: dict, keep_oversized: bool, timings: dict, timeout: float, info: dict = None) -> dict:
+        """الانتظار في طابور الـ governor ثم التحميل"""
+        # حجز مساحة وحصة من السرعة الكلية
+        job_id = await self.governor.acquire(ydl_opts)
+        if job_id is None:
+            result = {
                 "success": False,
-                "error": str(e)
+                "error_class": "busy",
+                "error": "السيرفر مشغول حالياً (مساحة التخزين ممتلئة). حاول بعد قليل."
             }
+        else:
+            # إيقاف الـ thread عند انتهاء المهلة (وإلا يستمر في الكتابة على نفس الملف)
+            abort = threading.Event()
+            
+            def abort_hook(d):
+                if abort.is_set():
+                    raise DownloadAborted()
+            ydl_opts['progress_hooks'].append(abort_hook)
+            
+            loop = asyncio.get_event_loop()
+            future = loop.run_in_executor(
+                None,
+                profiler.bind(lambda: self._download_sync(url, ydl_opts, keep_oversized, timings, info))
+            )
+            try:
+                # تشغيل التحميل مع timeout
+                result = await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+                
+            except asyncio.CancelledError:
+                abort.set()
+                raise
+            except asyncio.TimeoutError:
+                abort.set()
+                try:
+                    await asyncio.wait_for(future, timeout=15)
+                except Exception:
+                    pass
+                result = {
+                    "success": False,
+                    "error_class": "timeout",
+                    "error": "انتهت مهلة التحميل. جرب فيديو أقصر."
+                }
+            except Exception as e:
+                result = {
+                    "success": False,
+                    "error_class": "exception",
+                    "error": str(e)
+                }
+            finally:
+                await self.governor.release(job_id)
+        return result
     
-    def _download_sync(self, url: str, ydl_opts: dict) -> dict:
-        """تحميل متزامن"""
+    @profiler.traced("_download_sync", profile=True)
+    def _download_sync(self, url: str, ydl_opts: dict, keep_oversized: bool = False, timings: dict = None, info: dict = None) -> dict:
+        """تحميل متزامن (info: نتيجة الفحص المسبق إن وجدت)"""
+        timings = {} if timings is None else timings
+        load_yt_dlp()
+        # أول progress hook = نهاية extract_info وبداية التحميل الفعلي
+        started = time.perf_counter()
+        first_progress = []
+        ydl_opts.setdefault('progress_hooks', []).append(
+            lambda d: first_progress or first_progress.append(time.perf_counter())
+        )
+        
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
+                if info:
+                    info = ydl.process_ie_result(info, download=True)
+                else:
+                    info = ydl.extract_info(url, download=True)
+                
+                finished = time.perf_counter()
+                if first_progress:
+                    timings["extract_info"] = first_progress[0] - started
+                    timings["download"] = finished - first_progress[0]
+                else:
+                    timings["extract_info"] = finished - started
+                for stage in ("extract_info", "download"):
+                    if stage in timings:
+                        STAGE_SECONDS.observe(timings[stage], stage)
                 
                 if info is None:
-                    return {"success": False, "error": "فشل في استخراج معلومات الفيديو"}
+                    return {"success": False, "error_class": "extract_failed", "error": "فشل في استخراج معلومات الفيديو"}
                 
                 title = info.get('title', 'video')
                 # تنظيف العنوان
                 title = re.sub(r'[<>:"/\\|?*]', '', title)[:100]
                 
-                file_path = ydl.prepare_filename(info)
+                # المسار النهائي بعد المعالجة (مثلاً تحويل الصوت)
+                requested = info.get('requested_downloads') or [{}]
+                file_path = requested[0].get('filepath') or ydl.prepare_filename(info)
                 
                 # البحث عن الملف (قد يكون بامتداد مختلف)
                 if not os.path.exists(file_path):
                     base_path = os.path.splitext(file_path)[0]
-                    for ext in ['.mp4', '.webm', '.mkv', '.mov', '.avi', '.flv']:
+                    for ext in ['.mp4', '.webm', '.mkv', '.mov', '.avi', '.flv', '.m4a', '.mp3', '.opus', '.ogg']:
                         if os.path.exists(base_path + ext):
                             file_path = base_path + ext
                             break
                 
                 if os.path.exists(file_path):
+                    check_started = time.perf_counter()
                     file_size = os.path.getsize(file_path)
-                    max_size = MAX_FILE_SIZE_MB * 1024 * 1024
+                    max_mb = settings.current.max_file_size_mb
+                    max_size = int(max_mb * 1024 * 1024)
+                    timings["size_check"] = time.perf_counter() - check_started
+                    STAGE_SECONDS.observe(timings["size_check"], "size_check")
                     
                     if file_size > max_size:
+                        error = f"الفيديو كبير جداً ({file_size // (1024*1024)}MB). الحد الأقصى {max_mb:g}MB"
+                        # الاحتفاظ بالملف لتقسيمه إلى أجزاء
+                        if keep_oversized:
+                            return {
+                                "success": False,
+                                "too_large": True,
+                                "error_class": "too_large",
+                                "file_path": file_path,
+                                "file_size": file_size,
+                                "title": title,
+                                "duration": info.get('duration', 0),
+                                "error": error
+                            }
                         os.remove(file_path)
                         return {
                             "success": False,
-                            "error": f"الفيديو كبير جداً ({file_size // (1024*1024)}MB). الحد الأقصى {MAX_FILE_SIZE_MB}MB"
+                            "error_class": "too_large",
+                            "error": error
                         }
                     
                     return {
                         "success": True,
                         "file_path": file_path,
+                        "file_size": file_size,
                         "title": title,
+                        "video_id": f"{info.get('extractor_key', info.get('extractor', ''))}:{info.get('id', '')}",
                         "duration": info.get('duration', 0),
                         "platform": info.get('extractor', 'Unknown'),
+                        "performer": info.get('artist') or info.get('uploader'),
                         "thumbnail": info.get('thumbnail'),
                         "view_count": info.get('view_count', 0),
                     }
                 else:
-                    return {"success": False, "error": "الملف لم يتم تحميله بشكل صحيح"}
+                    return {"success": False, "error_class": "missing_file", "error": "الملف لم يتم تحميله بشكل صحيح"}
                     
+        except MemoryLimitExceeded as e:
+            self._discard_partial(e.args[0] if e.args else None)
+            return {"success": False, "error_class": "memory_overflow", "error": "الفيديو أكبر من حد الذاكرة"}
         except yt_dlp.utils.DownloadError as e:
-            error_msg = str(e).lower()
-            
-            if "video unavailable" in error_msg or "not available" in error_msg:
-                return {"success": False, "error": "الفيديو غير متوفر أو محذوف"}
-            elif "private" in error_msg:
-                return {"success": False, "error": "الفيديو خاص"}
-            elif "sign in" in error_msg or "login" in error_msg:
-                return {"success": False, "error": "الفيديو يتطلب تسجيل الدخول"}
-            elif "copyright" in error_msg:
-                return {"success": False, "error": "الفيديو محمي بحقوق النشر"}
-            elif "age" in error_msg:
-                return {"success": False, "error": "الفيديو مقيد بالعمر"}
-            elif "geo" in error_msg or "country" in error_msg:
-                return {"success": False, "error": "الفيديو غير متاح في منطقتك"}
-            else:
-                return {"success": False, "error": f"خطأ: {str(e)[:150]}"}
+            return self._classify_error(e)
         except Exception as e:
-            return {"success": False, "error": str(e)[:150]}
+            return {"success": False, "error_class": "exception", "error": str(e)[:150]}
+    
+    def _classify_error(self, e: Exception) -> dict:
+        """تصنيف خطأ yt-dlp إلى error_class ورسالة للمستخدم"""
+        error_msg = str(e).lower()
+        
+        if "video unavailable" in error_msg or "not available" in error_msg:
+            return {"success": False, "error_class": "unavailable", "error": "الفيديو غير متوفر أو محذوف"}
+        elif "private" in error_msg:
+            return {"success": False, "error_class": "private", "error": "الفيديو خاص"}
+        elif "sign in" in error_msg or "login" in error_msg:
+            return {"success": False, "error_class": "login_required", "error": "الفيديو يتطلب تسجيل الدخول"}
+        elif "copyright" in error_msg:
+            return {"success": False, "error_class": "copyright", "error": "الفيديو محمي بحقوق النشر"}
+        elif "age" in error_msg:
+            return {"success": False, "error_class": "age_restricted", "error": "الفيديو مقيد بالعمر"}
+        elif "geo" in error_msg or "country" in error_msg:
+            return {"success": False, "error_class": "geo_blocked", "error": "الفيديو غير متاح في منطقتك"}
+        elif any(marker in error_msg for marker in NETWORK_ERROR_MARKERS):
+            return {"success": False, "error_class": "network_error", "error": "انقطع الاتصال أثناء التحميل. حاول مرة أخرى."}
+        else:
+            return {"success": False, "error_class": "download_error", "error": f"خطأ: {str(e)[:150]}"}
     
     def cleanup_file(self, file_path: str):
         """حذف الملف بعد الإرسال"""
@@ -254,38 +827,81 @@ class VideoDownloader:
         except Exception as e:
             print(f"Error cleaning up file: {e}")
     
+    def _discard_partial(self, tmp_path: str):
+        """حذف الملف الجزئي وملحقاته (.ytdl و .part-FragN)"""
+        if not tmp_path:
+            return
+        directory, name = os.path.split(tmp_path)
+        base = name[:-len(".part")] if name.endswith(".part") else name
+        try:
+            for filename in os.listdir(directory or "."):
+                if filename.startswith(base):
+                    os.remove(os.path.join(directory, filename))
+        except OSError:
+            pass
+    
+    def _storage_dirs(self) -> list:
+        """كل المجلدات التي قد تحتوي ملفات تحميل"""
+        return [self.download_dir] + ([self.memory.path] if self.memory.enabled else [])
+    
     def _cleanup_user_files(self, user_id: int):
-        """حذف ملفات المستخدم القديمة"""
+        """
+        حذف ملفات المستخدم المتروكة (أقدم من PARTIAL_RETENTION_MINUTES)
+        الملفات الحديثة تخص طلبات جارية أو ملفات جزئية للاستكمال
+        """
         try:
             prefix = f"{user_id}_"
-            for filename in os.listdir(self.download_dir):
-                if filename.startswith(prefix):
-                    file_path = os.path.join(self.download_dir, filename)
-                    try:
-                        os.remove(file_path)
-                    except:
-                        pass
+            grace_cutoff = time.time() - PARTIAL_RETENTION_MINUTES * 60
+            for directory in self._storage_dirs():
+                for filename in os.listdir(directory):
+                    if filename.startswith(prefix):
+                        file_path = os.path.join(directory, filename)
+                        try:
+                            if os.path.getmtime(file_path) > grace_cutoff:
+                                continue
+                            os.remove(file_path)
+                        except:
+                            pass
         except:
             pass
     
+    def cleanup_temp_files(self) -> int:
+        """
+        حذف الملفات المؤقتة عند الإيقاف (الملفات الجزئية على القرص تبقى لاستكمالها بعد التشغيل)
+        Returns: عدد الملفات المحذوفة
+        """
+        removed = 0
+        for directory in self._storage_dirs():
+            try:
+                filenames = os.listdir(directory)
+            except OSError:
+                continue
+            for filename in filenames:
+                if directory == self.download_dir and is_partial_file(filename):
+                    continue
+                try:
+                    os.remove(os.path.join(directory, filename))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+    
     def cleanup_old_files(self, max_age_hours: int = 1):
         """حذف الملفات القديمة"""
         try:
             current_time = time.time()
             max_age_seconds = max_age_hours * 3600
             
-            for filename in os.listdir(self.download_dir):
-                file_path = os.path.join(self.download_dir, filename)
-                if os.path.isfile(file_path):
-                    file_age = current_time - os.path.getmtime(file_path)
-                    if file_age > max_age_seconds:
-                        try:
-                            os.remove(file_path)
-                        except:
-                            pass
+            for directory in self._storage_dirs():
+                for filename in os.listdir(directory):
+                    file_path = os.path.join(directory, filename)
+                    if os.path.isfile(file_path):
+                        file_age = current_time - os.path.getmtime(file_path)
+                        if file_age > max_age_seconds:
+                            try:
+                                os.remove(file_path)
+                            except:
+                                pass
         except:
             pass
 
-
-# إنشاء instance
-downloader = VideoDownloader()
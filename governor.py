@@ -0,0 +1,196 @@
+# 🚦 التحكم في سرعة التحميل ومساحة القرص والذاكرة
+# ================================
+
+import os
+import time
+import shutil
+import asyncio
+from config import (
+    TOTAL_DOWNLOAD_BANDWIDTH_MBPS, MIN_FREE_DISK_MB,
+    JOB_DISK_RESERVATION_MB, ADMISSION_WAIT_SECONDS
+)
+
+MB = 1024 * 1024
+
+
+class DownloadGovernor:
+    def __init__(self, download_dir: str):
+        self.download_dir = download_dir
+        # Mbps -> bytes/s
+        self.total_rate = TOTAL_DOWNLOAD_BANDWIDTH_MBPS * 1_000_000 / 8 if TOTAL_DOWNLOAD_BANDWIDTH_MBPS else None
+        self.min_free = MIN_FREE_DISK_MB * MB
+        self.jobs = {}
+        self.rejected = 0
+        self.waiting = 0
+        self._next_id = 0
+        self._cond = None
+
+    def _condition(self) -> asyncio.Condition:
+        """إنشاء Condition داخل الـ event loop الحالي"""
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def free_bytes(self) -> int:
+        """المساحة الحرة في مجلد التحميلات"""
+        try:
+            return shutil.disk_usage(self.download_dir).free
+        except OSError:
+            return 0
+
+    def reserved_bytes(self) -> int:
+        """مجموع المساحة المحجوزة للتحميلات الجارية"""
+        return sum(
+            max(0, max(job["reserved"], job["expected"]) - job["downloaded"])
+            for job in self.jobs.values()
+        )
+
+    def _has_room(self, projected: int) -> bool:
+        return self.free_bytes() - self.reserved_bytes() - projected >= self.min_free
+
+    async def acquire(self, ydl_opts: dict, projected: int = None):
+        """
+        حجز مكان لتحميل جديد (ينتظر في الطابور إذا كان القرص ممتلئاً)
+        Returns: job_id أو None إذا انتهت مهلة الانتظار
+        """
+        projected = projected or JOB_DISK_RESERVATION_MB * MB
+        cond = self._condition()
+
+        self.waiting += 1
+        try:
+            async with cond:
+                await asyncio.wait_for(
+                    cond.wait_for(lambda: self._has_room(projected)),
+                    timeout=ADMISSION_WAIT_SECONDS
+                )
+                self._next_id += 1
+                job_id = self._next_id
+                job = {
+                    "opts": ydl_opts,
+                    "reserved": projected,
+                    "expected": 0,
+                    "downloaded": 0,
+                    "speed": 0.0,
+                    "started": time.time(),
+                }
+                self.jobs[job_id] = job
+                ydl_opts.setdefault('progress_hooks', []).append(self._progress_hook(job))
+                self._rebalance()
+                return job_id
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return None
+        finally:
+            self.waiting -= 1
+
+    async def release(self, job_id: int):
+        """تحرير المكان وإعادة توزيع السرعة على التحميلات المتبقية"""
+        cond = self._condition()
+        async with cond:
+            self.jobs.pop(job_id, None)
+            self._rebalance()
+            cond.notify_all()
+
+    def _rebalance(self):
+        """تقسيم السرعة الكلية بالتساوي بين التحميلات الجارية"""
+        if not self.total_rate or not self.jobs:
+            return
+        share = self.total_rate / len(self.jobs)
+        for job in self.jobs.values():
+            opts = job["opts"]
+            # كل جزء متوازٍ يطبق الحد وحده، لذلك نقسم الحصة عليها
+            fragments = max(1, opts.get('concurrent_fragment_downloads', 1))
+            # yt-dlp يقرأ ratelimit من نفس القاموس أثناء التحميل
+            opts['ratelimit'] = max(1, int(share / fragments))
+
+    @staticmethod
+    def _progress_hook(job: dict):
+        """تحديث حجم التحميل والسرعة (يعمل داخل thread التحميل)"""
+        def hook(d):
+            if d.get('status') != 'downloading':
+                return
+            job["downloaded"] = d.get('downloaded_bytes') or 0
+            job["expected"] = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            job["speed"] = d.get('speed') or 0.0
+        return hook
+
+    def report(self) -> dict:
+        """حالة التحميل الحالية"""
+        return {
+            "active_jobs": len(self.jobs),
+            "waiting": self.waiting,
+            "throughput": sum(job["speed"] for job in self.jobs.values()),
+            "reserved": self.reserved_bytes(),
+            "free": self.free_bytes(),
+            "rate_limit": self.total_rate,
+            "rejected": self.rejected,
+        }
+
+
+class MemoryBudget:
+    """
+    مساحة في الذاكرة (tmpfs) للفيديوهات الصغيرة: لا كتابة على القرص
+    الاستهلاك = حجم الملفات الموجودة في المجلد + الحجوزات للتحميلات الجارية
+    """
+
+    def __init__(self, path: str, budget_mb: float):
+        self.budget = budget_mb * MB
+        self.path = path if path and budget_mb else None
+        if self.path:
+            try:
+                os.makedirs(self.path, exist_ok=True)
+            except OSError as e:
+                print(f"Memory download dir disabled: {e}")
+                self.path = None
+        self.reservations = {}
+        self.fallbacks = 0
+        self._next_id = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def used_bytes(self) -> int:
+        """حجم الملفات الموجودة حالياً في الذاكرة"""
+        total = 0
+        try:
+            for entry in os.scandir(self.path):
+                try:
+                    total += entry.stat().st_size
+                except OSError:
+                    pass
+        except OSError:
+            pass
+        return total
+
+    def reserve(self, estimate: int):
+        """
+        حجز مكان لملف صغير
+        Returns: رقم الحجز أو None (التحميل على القرص)
+        """
+        if not self.enabled:
+            return None
+        used = self.used_bytes() + sum(self.reservations.values())
+        try:
+            free = shutil.disk_usage(self.path).free
+        except OSError:
+            free = 0
+        if used + estimate > self.budget or free < estimate:
+            self.fallbacks += 1
+            return None
+        self._next_id += 1
+        self.reservations[self._next_id] = estimate
+        return self._next_id
+
+    def release(self, reservation_id: int):
+        """انتهى التحميل: الملف نفسه يُحسب من المجلد"""
+        self.reservations.pop(reservation_id, None)
+
+    def report(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "used": self.used_bytes() if self.enabled else 0,
+            "reserved": sum(self.reservations.values()),
+            "budget": self.budget,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,148 @@
+# 🩺 صحة المنصات و Circuit Breaker
+# ================================
+# لكل منصة: نافذة لآخر النتائج (نجاح/فشل + المدة).
+# إذا تجاوزت نسبة الفشل الحد يُفتح الـ breaker:
+#   - open: رفض فوري أو إعدادات بديلة أخف (حسب المنصة)
+#   - half_open: بعد مدة الانتظار نسمح بطلب تجريبي واحد بالإعدادات العادية
+#   - نجاح التجربة يغلق الـ breaker، وفشلها يعيد فتحه بمدة أطول
+
+import time
+from collections import deque
+from config import (
+    HEALTH_WINDOW, HEALTH_MIN_REQUESTS, HEALTH_FAILURE_RATE,
+    BREAKER_OPEN_SECONDS, BREAKER_MAX_OPEN_SECONDS, BREAKER_FALLBACK_PROFILES
+)
+from metrics import BREAKER_TRANSITIONS
+
+# أخطاء تعني أن المنصة نفسها لا تستجيب (الباقي مشكلة في الفيديو نفسه)
+PLATFORM_ERRORS = {"extract_failed", "download_error", "network_error", "timeout", "exception", "missing_file"}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class PlatformState:
+    def __init__(self):
+        # (نجاح؟، المدة بالثواني)
+        self.window = deque(maxlen=HEALTH_WINDOW)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.open_seconds = BREAKER_OPEN_SECONDS
+        self.probing = False
+        self.fallback_ok = 0
+        self.fallback_failed = 0
+        self.rejected = 0
+
+    def failure_rate(self) -> float:
+        if not self.window:
+            return 0.0
+        return sum(1 for ok, _ in self.window if not ok) / len(self.window)
+
+    def latency(self, pct: float) -> float:
+        """زمن الطلبات الناجحة (نسبة مئوية)"""
+        samples = sorted(elapsed for ok, elapsed in self.window if ok)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(pct / 100 * len(samples)))]
+
+
+class PlatformHealth:
+    def __init__(self):
+        self.platforms = {}
+
+    def _get(self, platform: str) -> PlatformState:
+        state = self.platforms.get(platform)
+        if state is None:
+            state = self.platforms[platform] = PlatformState()
+        return state
+
+    def _transition(self, platform: str, state: PlatformState, new_state: str):
+        if state.state != new_state:
+            state.state = new_state
+            BREAKER_TRANSITIONS.inc(platform, new_state)
+            print(f"Circuit breaker {platform}: {new_state}")
+
+    def admit(self, platform: str) -> str:
+        """
+        قرار الطلب الجديد
+        Returns: "normal" أو "probe" أو "fallback" أو "reject"
+        """
+        state = self._get(platform)
+        if state.state == CLOSED:
+            return "normal"
+
+        if state.state == OPEN and time.time() - state.opened_at >= state.open_seconds:
+            self._transition(platform, state, HALF_OPEN)
+
+        if state.state == HALF_OPEN and not state.probing:
+            state.probing = True
+            return "probe"
+
+        if platform in BREAKER_FALLBACK_PROFILES:
+            return "fallback"
+        state.rejected += 1
+        return "reject"
+
+    def apply_fallback(self, platform: str, ydl_opts: dict):
+        """استبدال الإعدادات بالإعدادات البديلة للمنصة"""
+        ydl_opts.update(BREAKER_FALLBACK_PROFILES[platform])
+
+    def record(self, platform: str, mode: str, result: dict, elapsed: float):
+        """تسجيل نتيجة طلب وتحديث حالة الـ breaker"""
+        state = self._get(platform)
+        if mode == "probe":
+            state.probing = False
+        error_class = result.get('error_class')
+        if error_class in ("busy", "platform_down", "cancelled", "shutdown"):
+            return
+        ok = result.get('success') or error_class not in PLATFORM_ERRORS
+
+        if mode == "fallback":
+            # الإعدادات البديلة لا تغير حالة الـ breaker
+            if ok:
+                state.fallback_ok += 1
+            else:
+                state.fallback_failed += 1
+            return
+
+        if mode == "probe":
+            if ok:
+                state.window.clear()
+                state.open_seconds = BREAKER_OPEN_SECONDS
+                self._transition(platform, state, CLOSED)
+            else:
+                state.open_seconds = min(state.open_seconds * 2, BREAKER_MAX_OPEN_SECONDS)
+                state.opened_at = time.time()
+                self._transition(platform, state, OPEN)
+            state.window.append((ok, elapsed))
+            return
+
+        state.window.append((ok, elapsed))
+        if (state.state == CLOSED
+                and len(state.window) >= HEALTH_MIN_REQUESTS
+                and state.failure_rate() >= HEALTH_FAILURE_RATE):
+            state.opened_at = time.time()
+            self._transition(platform, state, OPEN)
+
+    def report(self) -> dict:
+        """حالة كل منصة للوحة المشرف"""
+        now = time.time()
+        report = {}
+        for platform, state in sorted(self.platforms.items()):
+            retry_in = 0
+            if state.state == OPEN:
+                retry_in = max(0, int(state.opened_at + state.open_seconds - now))
+            report[platform] = {
+                "state": state.state,
+                "requests": len(state.window),
+                "success_rate": 1 - state.failure_rate(),
+                "p50": state.latency(50),
+                "p95": state.latency(95),
+                "retry_in": retry_in,
+                "fallback": platform in BREAKER_FALLBACK_PROFILES,
+                "fallback_ok": state.fallback_ok,
+                "fallback_failed": state.fallback_failed,
+                "rejected": state.rejected,
+            }
+        return report
@@ -0,0 +1,183 @@
+# 🛑 الإيقاف الآمن (SIGTERM أثناء التحديث)
+# ================================
+# - كل update يمر عبر JobTracker (بدل المعالج الافتراضي لـ PTB) فيُعرف ما هو قيد التنفيذ
+# - عند الإيقاف: لا طلبات جديدة، والتحميل/الرفع الجاري له مهلة للانتهاء
+# - طلبات التحميل التي لم تبدأ (أو انقطعت عند انتهاء المهلة) تُحفظ في PENDING_JOBS_FILE
+#   وتُعاد عند التشغيل التالي (drop_pending_updates يحذفها من Telegram)،
+#   بدون الروابط التي وصلت للمستخدم. باقي الأوامر لا تُعاد
+# - في النهاية: تقرير بمدة الإيقاف وعدد الطلبات المنتهية والمؤجلة والمقطوعة
+
+import os
+import json
+import time
+import asyncio
+import contextvars
+from telegram.error import TelegramError
+from telegram.ext import BaseUpdateProcessor
+from config import PENDING_JOBS_FILE, PENDING_JOBS_MAX_AGE_MINUTES
+
+# الطلب الحالي (يصل للـ tasks الفرعية مثل روابط الدفعة)
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+# الرد على الرسائل التي تصل أثناء الإيقاف ولا تُحفظ
+RESTARTING_TEXT = "🔄 The bot is restarting, please try again in a moment."
+
+
+def start_job_url(url: str):
+    """تسجيل رابط يعالجه الطلب الحالي"""
+    job = _current_job.get()
+    if job is not None:
+        job["urls"].setdefault(url, False)
+
+
+def finish_job_url(url: str):
+    """الرابط وصل للمستخدم: لا يُعاد بعد إعادة التشغيل"""
+    job = _current_job.get()
+    if job is not None:
+        job["urls"][url] = True
+
+
+def defer_current_job(url: str = None):
+    """تعليم الطلب الحالي ليُعاد بعد إعادة التشغيل"""
+    job = _current_job.get()
+    if job is not None:
+        job["deferred"] = True
+        if url:
+            job["urls"].setdefault(url, False)
+
+
+def is_replayed_job() -> bool:
+    """هل الطلب الحالي مُعاد من تشغيل سابق"""
+    job = _current_job.get()
+    return bool(job and job["replayed"])
+
+
+class JobTracker(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int, replayable, path: str = PENDING_JOBS_FILE):
+        """replayable(update): هل هو طلب تحميل يمكن إعادته بعد التشغيل"""
+        super().__init__(max_concurrent_updates)
+        self.replayable = replayable
+        self.path = path
+        self.draining = False
+        # task -> الطلب (للانتظار ثم القطع عند انتهاء المهلة)
+        self.jobs = {}
+        self.pending = []
+        self.replayed = set()
+        self.counts = {"finished": 0, "deferred": 0, "dropped": 0}
+        self._drain_started = 0.0
+        self._drain_task = None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update, coroutine):
+        if self.draining and getattr(update, "message", None):
+            # وصل بعد بدء الإيقاف: طلب التحميل يُحفظ بدون تنفيذ، والباقي يُرفض
+            coroutine.close()
+            if self.replayable(update):
+                self._keep(update, {"urls": {}}, "deferred")
+            else:
+                self.counts["dropped"] += 1
+                try:
+                    await update.message.reply_text(RESTARTING_TEXT)
+                except TelegramError:
+                    pass
+            return
+
+        job = {
+            "deferred": False,
+            # رابط -> وصل للمستخدم؟
+            "urls": {},
+            "replayed": getattr(update, "update_id", None) in self.replayed,
+        }
+        _current_job.set(job)
+        task = asyncio.current_task()
+        self.jobs[task] = job
+        try:
+            await coroutine
+        except asyncio.CancelledError:
+            if self.draining:
+                self._keep(update, job, "dropped")
+            raise
+        finally:
+            self.jobs.pop(task, None)
+
+        if job["deferred"]:
+            self._keep(update, job, "deferred")
+        elif self.draining:
+            self.counts["finished"] += 1
+
+    def _keep(self, update, job: dict, outcome: str):
+        """حفظ طلب التحميل للتشغيل التالي (الأزرار والأوامر الأخرى لا تُعاد)"""
+        if getattr(update, "message", None) is None or not self.replayable(update):
+            self.counts["dropped"] += 1
+            return
+        remaining = [url for url, delivered in job["urls"].items() if not delivered]
+        if job["urls"] and not remaining:
+            # كل الروابط وصلت قبل القطع
+            self.counts["finished"] += 1
+            return
+        self.counts[outcome] += 1
+        data = update.to_dict()
+        # جزء من الروابط وصل: إعادة الباقي فقط (كرسالة روابط عادية)
+        if len(remaining) < len(job["urls"]):
+            data["message"]["text"] = "\n".join(remaining)
+            data["message"].pop("entities", None)
+        self.pending.append(data)
+
+    def begin_drain(self, timeout: float):
+        """إيقاف استقبال الطلبات وبدء مهلة الانتهاء"""
+        self.draining = True
+        self._drain_started = time.monotonic()
+        self._drain_task = asyncio.create_task(self._drain(timeout))
+
+    async def _drain(self, timeout: float):
+        deadline = self._drain_started + timeout
+        while self.jobs and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        self.drop_all()
+
+    def drop_all(self):
+        """قطع كل الطلبات الجارية (انتهت المهلة أو إشارة إيقاف ثانية)"""
+        for task in list(self.jobs):
+            task.cancel()
+
+    def report(self) -> dict:
+        """ملخص الإيقاف"""
+        return {
+            **self.counts,
+            "duration": time.monotonic() - self._drain_started if self.draining else 0.0,
+            "saved": len(self.pending),
+        }
+
+    def save_pending(self):
+        """حفظ الطلبات المؤجلة (كتابة ذرية)"""
+        if not self.pending:
+            return
+        try:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"saved_at": time.time(), "updates": self.pending}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"Error saving pending jobs: {e}")
+
+    def load_pending(self) -> list:
+        """الطلبات المحفوظة من التشغيل السابق (تُحذف من الملف بعد قراءتها)"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            os.remove(self.path)
+        except FileNotFoundError:
+            return []
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error loading pending jobs: {e}")
+            return []
+        if time.time() - state.get("saved_at", 0) > PENDING_JOBS_MAX_AGE_MINUTES * 60:
+            return []
+        updates = state.get("updates", [])
+        self.replayed.update(data.get("update_id") for data in updates)
+        return updates
@@ -0,0 +1,189 @@
+# 📈 مقاييس الأداء بصيغة Prometheus
+# ================================
+
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# حدود الـ histogram بالثواني (من أجزاء الثانية حتى عدة دقائق)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{str(v).replace(chr(34), "")}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        """زيادة العداد"""
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        return self.values.get(label_values, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self.values.items())
+        for values, count in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {count}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str, func=None):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.func = func
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, func):
+        """قراءة القيمة عند كل طلب /metrics بدل تحديثها يدوياً"""
+        self.func = func
+
+    def render(self) -> list:
+        value = self.func() if self.func else self.value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label_values -> [counts لكل حد + inf, sum]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        """تسجيل قيمة"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        """قياس مدة كتلة كود"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((values, (list(counts), total)) for values, (counts, total) in self.values.items())
+        for values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound}"
+                labels = _format_labels(self.labels, values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, func=None) -> Gauge:
+        metric = Gauge(name, help_text, func)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """النص الكامل بصيغة Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# مراحل الطلب: classify, probe, queue_wait, extract_info, download, size_check, upload, ad_send, send_wait
+STAGE_SECONDS = registry.histogram("bot_stage_seconds", "Latency of each request stage", ("stage",))
+REQUESTS = registry.counter("bot_requests_total", "Handled download requests", ("mode", "outcome"))
+CACHE_LOOKUPS = registry.counter("bot_cache_lookups_total", "file_id cache lookups", ("namespace", "result"))
+NEGATIVE_CACHE_HITS = registry.counter("bot_negative_cache_hits_total", "Requests answered from the negative cache", ("error_class",))
+BYTES_DOWNLOADED = registry.counter("bot_downloaded_bytes_total", "Bytes downloaded", ("platform",))
+BYTES_UPLOADED = registry.counter("bot_uploaded_bytes_total", "Bytes uploaded to Telegram", ("platform",))
+DOWNLOAD_ERRORS = registry.counter("bot_download_errors_total", "Download failures by class", ("platform", "error_class"))
+DOWNLOAD_STORAGE = registry.counter("bot_download_storage_total", "Completed downloads by storage (memory/disk) and memory overflows", ("storage",))
+DOWNLOAD_RETRIES = registry.counter("bot_download_retries_total", "Downloads retried with resume after a network error", ("platform",))
+BREAKER_TRANSITIONS = registry.counter("bot_breaker_transitions_total", "Circuit breaker state changes", ("platform", "state"))
+SEND_COALESCED = registry.counter("bot_send_coalesced_total", "Outgoing requests dropped as superseded", ("endpoint",))
+SEND_RETRY_AFTER = registry.counter("bot_send_retry_after_total", "RetryAfter responses retried by the scheduler", ("endpoint",))
+QUEUE_DEPTH = registry.gauge("bot_download_queue_depth", "Downloads waiting for admission")
+IN_FLIGHT = registry.gauge("bot_downloads_in_flight", "Downloads currently running")
+MEMORY_USED = registry.gauge("bot_memory_download_bytes", "Bytes of downloads held in the tmpfs directory")
+SEND_QUEUED = registry.gauge("bot_send_queue_depth", "Outgoing Bot API requests waiting for a send slot")
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """خادم HTTP بسيط: GET /metrics فقط"""
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # تجاهل باقي الـ headers
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            body = registry.render().encode()
+            status = "200 OK"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int):
+    """تشغيل endpoint /metrics داخل نفس الـ event loop"""
+    return await asyncio.start_server(_handle_http, host, port)
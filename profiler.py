@@ -0,0 +1,165 @@
+# 🔬 تتبع الطلبات البطيئة (spans + cProfile)
+# ================================
+# عند التعطيل: كل span يكلف فقط فحص متغير واحد.
+# عند التفعيل: كل طلب يسجل مدة كل مرحلة، و thread التحميل يعمل تحت cProfile.
+# التقارير تُحفظ فقط للطلبات الأبطأ من PROFILE_SLOW_SECONDS.
+
+import io
+import time
+import pstats
+import cProfile
+import asyncio
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from config import PROFILING_ENABLED, PROFILE_SLOW_SECONDS, PROFILE_KEEP, PROFILE_TOP_FUNCTIONS
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.ts = time.time()
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.fields = {}
+        # (الاسم، بداية المرحلة من أول الطلب، المدة)
+        self.spans = []
+        self.profile = None
+        self.report = None
+
+    def add_span(self, name: str, start: float, elapsed: float):
+        self.spans.append((name, start - self.started, elapsed))
+
+    def render(self) -> str:
+        """تقرير نصي: المراحل ثم أثقل الدوال"""
+        lines = [f"{self.name} - {self.total:.2f}s - {datetime.fromtimestamp(self.ts):%Y-%m-%d %H:%M:%S}"]
+        if self.fields:
+            lines.append("  ".join(f"{k}={v}" for k, v in self.fields.items()))
+        lines.append("")
+        lines.append("Spans:")
+        for name, offset, elapsed in sorted(self.spans, key=lambda s: s[1]):
+            lines.append(f"  +{offset:8.3f}s  {name:<24}{elapsed:9.3f}s")
+        if self.profile:
+            buf = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=buf)
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+            lines.append("")
+            lines.append("cProfile (download thread):")
+            lines.append(buf.getvalue())
+        return "\n".join(lines)
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = PROFILING_ENABLED
+        self.threshold = PROFILE_SLOW_SECONDS
+        self.slow = deque(maxlen=PROFILE_KEEP)
+        self.requests = 0
+        # cProfile واحد فقط في نفس الوقت (Python 3.12 يسمح بأداة profiling واحدة)
+        self._cprofile_lock = threading.Lock()
+
+    def set_enabled(self, enabled: bool, threshold: float = None):
+        self.enabled = enabled
+        if threshold is not None:
+            self.threshold = threshold
+
+    def request(self, name: str):
+        """decorator لمعالج طلب كامل (async)"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                # طلب داخل طلب (مثلاً playlist -> batch) يبقى في نفس الـ trace
+                if not self.enabled or _current_trace.get() is not None:
+                    return await func(*args, **kwargs)
+                trace = Trace(name)
+                token = _current_trace.set(trace)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _current_trace.reset(token)
+                    self._finish(trace)
+            return wrapper
+        return decorator
+
+    def annotate(self, **fields):
+        """إضافة معلومات للطلب الحالي (الرابط، النتيجة...)"""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.fields.update({k: v for k, v in fields.items() if v is not None})
+
+    @contextmanager
+    def span(self, name: str):
+        """قياس مرحلة داخل الطلب الحالي"""
+        trace = _current_trace.get()
+        if trace is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            trace.add_span(name, start, time.perf_counter() - start)
+
+    def traced(self, name: str, profile: bool = False):
+        """decorator يضيف span حول دالة (sync أو async)"""
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if _current_trace.get() is None:
+                        return await func(*args, **kwargs)
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                trace = _current_trace.get()
+                if trace is None:
+                    return func(*args, **kwargs)
+                with self.span(name):
+                    if profile and trace.profile is None and self._cprofile_lock.acquire(blocking=False):
+                        prof = cProfile.Profile()
+                        try:
+                            return prof.runcall(func, *args, **kwargs)
+                        finally:
+                            trace.profile = prof
+                            self._cprofile_lock.release()
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def bind(self, func):
+        """نقل الطلب الحالي إلى thread (run_in_executor لا ينقل contextvars)"""
+        if _current_trace.get() is None:
+            return func
+        return functools.partial(contextvars.copy_context().run, func)
+
+    def _finish(self, trace: Trace):
+        self.requests += 1
+        trace.total = time.perf_counter() - trace.started
+        if trace.total >= self.threshold:
+            trace.report = trace.render()
+            self.slow.append(trace)
+        # تحرير الـ profile الخام مباشرة (التقرير النصي يكفي)
+        trace.profile = None
+
+    def last(self, count: int) -> list:
+        """آخر التقارير البطيئة (الأحدث أولاً)"""
+        return list(self.slow)[-count:][::-1]
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "requests": self.requests,
+            "kept": len(self.slow),
+        }
+
+
+profiler = Profiler()
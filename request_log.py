@@ -0,0 +1,265 @@
+# 🧾 سجل الطلبات (JSONL) مع كاتب غير متزامن ومحلل للسجلات
+# ================================
+# كل طلب = سطر JSON واحد. الكتابة تتم في مهمة خلفية على دفعات
+# (الملف يُكتب داخل thread) حتى لا يتوقف الـ event loop أبداً.
+#
+# تحليل السجلات:
+#     python request_log.py logs/requests.jsonl logs/requests.jsonl.1
+
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import hashlib
+from contextlib import contextmanager
+from config import (
+    REQUEST_LOG_FILE, REQUEST_LOG_MAX_BYTES, REQUEST_LOG_BACKUPS,
+    REQUEST_LOG_FLUSH_SECONDS, REQUEST_LOG_SALT
+)
+from metrics import STAGE_SECONDS
+
+# أقصى عدد أسطر في الذاكرة قبل إسقاط الجديد (لا نحجب الطلبات أبداً)
+MAX_BUFFERED_LINES = 10000
+
+
+def hash_user(user_id: int) -> str:
+    """إخفاء هوية المستخدم"""
+    return hashlib.sha256(f"{REQUEST_LOG_SALT}:{user_id}".encode()).hexdigest()[:16]
+
+
+class RequestRecord:
+    def __init__(self, mode: str, user_id: int, platform: str, key: str):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.data = {
+            "ts": round(time.time(), 3),
+            "mode": mode,
+            "user": hash_user(user_id),
+            "platform": platform,
+            "key": key,
+        }
+
+    @contextmanager
+    def stage(self, name: str):
+        """قياس مرحلة وتسجيلها في السجل و metrics معاً"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            STAGE_SECONDS.observe(elapsed, name)
+
+    def add_stages(self, timings: dict):
+        """إضافة مراحل تم قياسها في مكان آخر (مثلاً داخل thread التحميل)"""
+        for name, elapsed in (timings or {}).items():
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def set(self, **fields):
+        self.data.update({k: v for k, v in fields.items() if v is not None})
+
+    def finish(self, outcome: str, **fields) -> dict:
+        self.set(**fields)
+        self.data["outcome"] = outcome
+        self.data["total_ms"] = round((time.perf_counter() - self.started) * 1000, 1)
+        self.data["stages_ms"] = {k: round(v * 1000, 1) for k, v in self.stages.items()}
+        return self.data
+
+
+class RequestLogger:
+    def __init__(self, path: str = REQUEST_LOG_FILE):
+        self.path = path
+        self.buffer = []
+        self.dropped = 0
+        self._task = None
+        self._wakeup = None
+
+    def begin(self, mode: str, user_id: int, platform: str, key: str) -> RequestRecord:
+        return RequestRecord(mode, user_id, platform, key)
+
+    def log(self, record: RequestRecord, outcome: str, **fields):
+        """إضافة سطر للذاكرة فقط (بدون أي I/O)"""
+        if len(self.buffer) >= MAX_BUFFERED_LINES:
+            self.dropped += 1
+            return
+        self.buffer.append(json.dumps(record.finish(outcome, **fields), ensure_ascii=False))
+        if self._wakeup and len(self.buffer) >= 500:
+            self._wakeup.set()
+
+    def start(self):
+        """تشغيل مهمة الكتابة داخل الـ event loop"""
+        if self._task is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._writer())
+
+    async def stop(self):
+        """إيقاف المهمة وكتابة ما تبقى"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+    async def _writer(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=REQUEST_LOG_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error writing request log: {e}")
+
+    def _write(self, data: bytes):
+        """الكتابة مع تدوير الملف حسب الحجم (تعمل داخل thread)"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size and size + len(data) > REQUEST_LOG_MAX_BYTES:
+            self._rotate()
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+    def _rotate(self):
+        for i in range(REQUEST_LOG_BACKUPS - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if REQUEST_LOG_BACKUPS > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+# ============== المحلل (بذاكرة ثابتة) ==============
+
+class LatencySketch:
+    """histogram لوغاريتمي: دقة ~5% بعدد ثابت من الخانات"""
+    BASE_MS = 1.0
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+
+    def add(self, value_ms: float):
+        index = 0 if value_ms <= self.BASE_MS else int(math.log(value_ms / self.BASE_MS, self.GROWTH)) + 1
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+
+    def percentile(self, pct: float) -> float:
+        if not self.total:
+            return 0.0
+        rank = pct / 100 * self.total
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return self.BASE_MS * self.GROWTH ** index
+        return 0.0
+
+
+class DistinctCounter:
+    """HyperLogLog لتقدير عدد الروابط المختلفة بذاكرة ثابتة (16KB)"""
+    P = 14
+
+    def __init__(self):
+        self.m = 1 << self.P
+        self.registers = bytearray(self.m)
+
+    def add(self, value: str):
+        h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = h >> (64 - self.P)
+        rest = h & ((1 << (64 - self.P)) - 1)
+        rank = (64 - self.P) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> float:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            return self.m * math.log(self.m / zeros)
+        return estimate
+
+
+def analyze(paths: list):
+    """قراءة السجلات سطراً بسطر وطباعة ملخص لكل منصة"""
+    platforms = {}
+    distinct = DistinctCounter()
+    total = 0
+    bad = 0
+
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    bad += 1
+                    continue
+                total += 1
+                if row.get("key"):
+                    distinct.add(row["key"])
+
+                p = platforms.setdefault(row.get("platform", "unknown"), {
+                    "requests": 0, "success": 0, "cached": 0, "bytes": 0,
+                    "errors": {}, "total": LatencySketch(), "stages": {},
+                })
+                p["requests"] += 1
+                outcome = row.get("outcome")
+                if outcome in ("success", "split", "cached"):
+                    p["success"] += 1
+                if outcome == "cached":
+                    p["cached"] += 1
+                if row.get("error_class"):
+                    p["errors"][row["error_class"]] = p["errors"].get(row["error_class"], 0) + 1
+                p["bytes"] += row.get("bytes", 0) or 0
+                p["total"].add(row.get("total_ms", 0))
+                for stage, ms in (row.get("stages_ms") or {}).items():
+                    p["stages"].setdefault(stage, LatencySketch()).add(ms)
+
+    print(f"Requests: {total}" + (f" ({bad} unreadable lines)" if bad else ""))
+    if total:
+        unique = min(total, distinct.count())
+        print(f"Distinct links: ~{unique:.0f}  |  Cache-hit potential (repeat ratio): {1 - unique / total:.1%}")
+
+    for name, p in sorted(platforms.items(), key=lambda item: -item[1]["requests"]):
+        print("\n" + "=" * 64)
+        print(f"{name}: {p['requests']} requests, "
+              f"success {p['success'] / p['requests']:.1%}, "
+              f"cached {p['cached'] / p['requests']:.1%}, "
+              f"{p['bytes'] / (1024 * 1024):.1f} MB")
+        if p["errors"]:
+            errors = ", ".join(f"{k}={v}" for k, v in sorted(p["errors"].items(), key=lambda kv: -kv[1]))
+            print(f"  errors: {errors}")
+        print(f"  {'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage, sketch in [("total", p["total"])] + sorted(p["stages"].items()):
+            print(f"  {stage:<14}"
+                  f"{sketch.percentile(50):>10.0f}"
+                  f"{sketch.percentile(95):>10.0f}"
+                  f"{sketch.percentile(99):>10.0f}")
+
+
+if __name__ == "__main__":
+    files = sys.argv[1:] or [REQUEST_LOG_FILE]
+    analyze([f for f in files if os.path.exists(f)])
@@ -0,0 +1,147 @@
+# ⚖️ توزيع أماكن التحميل بعدل بين المستخدمين
+# ================================
+# Weighted Fair Queuing (start-time fair queuing):
+#   - عدد ثابت من أماكن التحميل المتزامنة (DOWNLOAD_SLOTS)
+#   - طابور لكل مستخدم، وكل طلب له تكلفة = مدة الفيديو (من فحص البيانات)
+#   - وزن المستخدم حسب مستواه (TIER_WEIGHTS): الوزن الأعلى = تقدم أسرع
+#   - يُمنح المكان للطلب صاحب أصغر "وقت انتهاء افتراضي":
+#     start + cost / weight، لذلك الفيديو القصير يتقدم على الطويل
+#   - وقت البداية لا يقل عن الوقت الافتراضي الحالي: من أرسل روابط كثيرة
+#     لا يحجز المستقبل كله، ومن ينتظر طويلاً لا يُتجاوز للأبد
+
+import time
+import heapq
+import asyncio
+import itertools
+from config import DOWNLOAD_SLOTS, FAIR_DEFAULT_DURATION, FAIR_MIN_COST_SECONDS, FAIR_MAX_COST_SECONDS
+
+
+def job_cost(duration) -> float:
+    """تكلفة الطلب بالثواني (مع حد أدنى وأقصى)"""
+    if not duration or duration <= 0:
+        duration = FAIR_DEFAULT_DURATION
+    return float(min(max(duration, FAIR_MIN_COST_SECONDS), FAIR_MAX_COST_SECONDS))
+
+
+class SchedulerClosed(Exception):
+    """البوت يتوقف: لا أماكن جديدة"""
+
+
+class _UserQueue:
+    def __init__(self, weight: float, start: float):
+        self.weight = weight
+        # (التكلفة، الترتيب، future): أقصر فيديو للمستخدم أولاً
+        self.heap = []
+        # وقت بداية الطلب التالي، ووقت انتهاء آخر طلب تم منحه
+        self.start = start
+        self.finish = start
+
+    def head(self):
+        """أول طلب ما زال ينتظر (مع حذف الملغى)"""
+        while self.heap and self.heap[0][-1].done():
+            heapq.heappop(self.heap)
+        return self.heap[0] if self.heap else None
+
+
+class FairScheduler:
+    def __init__(self, slots: int = DOWNLOAD_SLOTS):
+        self.slots = slots
+        self.active = 0
+        self.users = {}
+        # الوقت الافتراضي = وقت بداية آخر طلب تم منحه
+        self.vtime = 0.0
+        self.granted = 0
+        self.closed = False
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for queue in self.users.values() for *_, f in queue.heap if not f.done())
+
+    async def acquire(self, user_id: int, weight: float = 1.0, cost: float = None) -> float:
+        """
+        انتظار مكان تحميل
+        Returns: مدة الانتظار بالثواني
+        """
+        if self.closed:
+            raise SchedulerClosed()
+        started = time.perf_counter()
+        cost = job_cost(None) if cost is None else cost
+
+        queue = self.users.get(user_id)
+        if queue is None:
+            queue = self.users[user_id] = _UserQueue(weight, self.vtime)
+        elif queue.head() is None:
+            # المستخدم عاد بعد فترة: لا يستفيد من رصيد قديم ولا يُعاقب عليه
+            queue.start = max(self.vtime, queue.finish)
+        queue.weight = weight
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.heap, (cost, next(self._seq), future))
+        self._grant()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # تم المنح لحظة الإلغاء: إرجاع المكان
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        return time.perf_counter() - started
+
+    def release(self):
+        """تحرير مكان ومنحه للطلب التالي"""
+        self.active -= 1
+        self._grant()
+
+    def close(self) -> int:
+        """
+        رفض كل الطلبات المنتظرة وأي طلب جديد (عند إيقاف البوت)
+        Returns: عدد الطلبات المرفوضة
+        """
+        self.closed = True
+        rejected = 0
+        for queue in self.users.values():
+            for *_, future in queue.heap:
+                if not future.done():
+                    future.set_exception(SchedulerClosed())
+                    rejected += 1
+            queue.heap.clear()
+        self.users.clear()
+        return rejected
+
+    def _grant(self):
+        while self.active < self.slots:
+            best = None
+            for user_id, queue in list(self.users.items()):
+                head = queue.head()
+                if head is None:
+                    # حذف المستخدمين الخاملين الذين لم يعد لهم أثر على الترتيب
+                    if queue.finish <= self.vtime:
+                        del self.users[user_id]
+                    continue
+                cost, seq, _ = head
+                tag = (queue.start + cost / queue.weight, seq)
+                if best is None or tag < best[0]:
+                    best = (tag, queue)
+            if best is None:
+                return
+
+            (finish, _), queue = best
+            _, _, future = heapq.heappop(queue.heap)
+            self.vtime = max(self.vtime, queue.start)
+            queue.finish = finish
+            queue.start = finish
+            self.active += 1
+            self.granted += 1
+            future.set_result(None)
+
+    def report(self) -> dict:
+        """حالة الطابور للوحة المشرف"""
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "waiting": self.waiting,
+            "users_waiting": sum(1 for queue in self.users.values() if queue.head() is not None),
+            "granted": self.granted,
+        }
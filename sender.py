@@ -0,0 +1,255 @@
+# 📤 جدولة الرسائل الصادرة حسب حدود Telegram
+# ================================
+# كل طلبات Bot API تمر من هنا (rate_limiter الخاص بـ python-telegram-bot):
+#   - طابور لكل محادثة + token bucket لكل محادثة وللبوت كله
+#   - أولويات: الفيديوهات والنتائج قبل رسائل التقدم والإعلانات
+#   - تعديل جديد لنفس الرسالة يلغي التعديل القديم الذي لم يُرسل بعد
+#   - RetryAfter: إيقاف المحادثة مؤقتاً ثم إعادة المحاولة تلقائياً
+
+import time
+import heapq
+import asyncio
+import itertools
+from datetime import timedelta
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from config import (
+    SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST,
+    SEND_GROUP_RATE_PER_MINUTE, SEND_MAX_RETRIES
+)
+from metrics import STAGE_SECONDS, SEND_QUEUED, SEND_COALESCED, SEND_RETRY_AFTER
+
+# الأولويات (الأصغر أولاً)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_BULK = 3
+
+ENDPOINT_PRIORITY = {
+    "sendVideo": PRIORITY_HIGH,
+    "sendAudio": PRIORITY_HIGH,
+    "sendDocument": PRIORITY_HIGH,
+    "sendMediaGroup": PRIORITY_HIGH,
+    "sendMessage": PRIORITY_NORMAL,
+    "editMessageText": PRIORITY_LOW,
+    "deleteMessage": PRIORITY_LOW,
+    "sendChatAction": PRIORITY_LOW,
+}
+
+# ردود يجب أن تكون فورية (لا تخضع لحدود المحادثة)
+UNTHROTTLED = {"answerInlineQuery", "answerCallbackQuery"}
+# لا تُحسب على حد المحادثة (فقط الحد الكلي)
+CHAT_EXEMPT = {"deleteMessage", "sendChatAction"}
+EDIT_ENDPOINTS = ("editMessageText", "editMessageCaption", "editMessageReplyMarkup")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """الثواني المتبقية حتى يتوفر token"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Request:
+    __slots__ = ("priority", "seq", "key", "exempt", "future")
+
+    def __init__(self, priority: int, seq: int, key, exempt: bool, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.exempt = exempt
+        self.future = future
+
+
+class _ChatQueue:
+    def __init__(self, chat_id):
+        # المجموعات: 20 رسالة في الدقيقة، المحادثات الخاصة: رسالة في الثانية
+        if isinstance(chat_id, int) and chat_id > 0:
+            self.bucket = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+        else:
+            self.bucket = TokenBucket(SEND_GROUP_RATE_PER_MINUTE / 60, SEND_CHAT_BURST)
+        self.heap = []
+        self.paused_until = 0.0
+
+    def head(self):
+        """أول طلب ما زال ينتظر (مع حذف الملغى)"""
+        while self.heap and self.heap[0][-1].future.done():
+            heapq.heappop(self.heap)
+        return self.heap[0][-1] if self.heap else None
+
+    def wait_time(self, request: _Request, now: float) -> float:
+        wait = self.paused_until - now
+        if not request.exempt:
+            wait = max(wait, self.bucket.wait_time(now))
+        return max(0.0, wait)
+
+
+class SendScheduler(BaseRateLimiter[int]):
+    def __init__(self):
+        self.global_bucket = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_RATE)
+        self.chats = {}
+        # مفتاح الدمج -> الطلب المنتظر
+        self.pending = {}
+        self._seq = itertools.count()
+        self._ids = itertools.count()
+        self._wakeup = None
+        self._task = None
+        SEND_QUEUED.set_function(self.queued)
+
+    async def initialize(self):
+        # PTB يستدعيها مرتين (Application ثم Updater لنفس البوت): حلقة واحدة فقط،
+        # وإلا تبقى الأولى معلقة بلا مرجع ("Task was destroyed but it is pending")
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # إرسال ما تبقى مباشرة بدل تركه معلقاً
+        for queue in self.chats.values():
+            for *_, request in queue.heap:
+                if not request.future.done():
+                    request.future.set_result(True)
+        self.chats.clear()
+        self.pending.clear()
+
+    def queued(self) -> int:
+        """عدد الطلبات المنتظرة"""
+        return sum(1 for queue in self.chats.values() for *_, r in queue.heap if not r.future.done())
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if endpoint in UNTHROTTLED or chat_id is None or self._task is None:
+            return await callback(*args, **kwargs)
+
+        priority = rate_limit_args if isinstance(rate_limit_args, int) else ENDPOINT_PRIORITY.get(endpoint, PRIORITY_NORMAL)
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            started = time.perf_counter()
+            granted = await self._submit(chat_id, priority, endpoint, data)
+            STAGE_SECONDS.observe(time.perf_counter() - started, "send_wait")
+            if not granted:
+                # تم استبداله بتعديل أحدث أو بحذف الرسالة
+                SEND_COALESCED.inc(endpoint)
+                return True
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == SEND_MAX_RETRIES:
+                    raise
+                SEND_RETRY_AFTER.inc(endpoint)
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                queue = self._queue(chat_id)
+                queue.paused_until = max(queue.paused_until, time.monotonic() + retry_after)
+
+    def _queue(self, chat_id) -> _ChatQueue:
+        queue = self.chats.get(chat_id)
+        if queue is None:
+            queue = self.chats[chat_id] = _ChatQueue(chat_id)
+        return queue
+
+    @staticmethod
+    def _coalesce_key(endpoint: str, data: dict):
+        if endpoint in EDIT_ENDPOINTS:
+            return (endpoint, data.get("chat_id"), data.get("message_id"))
+        if endpoint == "sendChatAction":
+            return (endpoint, data.get("chat_id"))
+        return None
+
+    def _supersede(self, key):
+        old = self.pending.pop(key, None)
+        if old is not None and not old.future.done():
+            old.future.set_result(False)
+        return old
+
+    def _submit(self, chat_id, priority: int, endpoint: str, data: dict) -> asyncio.Future:
+        """إضافة طلب للطابور. النتيجة False = تم إلغاؤه (دمج)"""
+        key = self._coalesce_key(endpoint, data)
+        seq = next(self._seq)
+
+        if key is not None:
+            old = self._supersede(key)
+            if old is not None:
+                # التعديل الجديد يأخذ مكان القديم في الطابور
+                seq = min(seq, old.seq)
+                priority = min(priority, old.priority)
+        elif endpoint == "deleteMessage":
+            # لا فائدة من تعديل رسالة سيتم حذفها
+            for edit in EDIT_ENDPOINTS:
+                self._supersede((edit, chat_id, data.get("message_id")))
+
+        request = _Request(priority, seq, key, endpoint in CHAT_EXEMPT, asyncio.get_running_loop().create_future())
+        if key is not None:
+            self.pending[key] = request
+        heapq.heappush(self._queue(chat_id).heap, (priority, seq, next(self._ids), request))
+        self._wakeup.set()
+        return request.future
+
+    async def _dispatch(self):
+        """حلقة واحدة توزع الإذن بالإرسال حسب الأولوية والحدود"""
+        while True:
+            delay = self._grant_ready()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant_ready(self):
+        """منح كل ما يمكن إرساله الآن، وإرجاع مدة الانتظار حتى الطلب التالي"""
+        while True:
+            now = time.monotonic()
+            delay = None
+            best = None
+            for chat_id, queue in list(self.chats.items()):
+                request = queue.head()
+                if request is None:
+                    # حذف المحادثات الخاملة (الحد ممتلئ ولا يوجد إيقاف)
+                    if queue.paused_until <= now and queue.bucket.is_full(now):
+                        del self.chats[chat_id]
+                    continue
+                wait = queue.wait_time(request, now)
+                if wait > 0:
+                    delay = wait if delay is None else min(delay, wait)
+                elif best is None or (request.priority, request.seq) < (best[1].priority, best[1].seq):
+                    best = (queue, request)
+
+            if best is None:
+                return delay
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait > 0:
+                return global_wait if delay is None else min(delay, global_wait)
+
+            queue, request = best
+            heapq.heappop(queue.heap)
+            if not request.exempt:
+                queue.bucket.take()
+            self.global_bucket.take()
+            if request.key is not None and self.pending.get(request.key) is request:
+                del self.pending[request.key]
+            request.future.set_result(True)
@@ -0,0 +1,237 @@
+# ♻️ إعدادات قابلة للتعديل أثناء التشغيل (بدون إعادة تشغيل)
+# ================================
+# ملف JSON (SETTINGS_FILE) يغطي: الإعلانات، المنصات المدعومة، حجم الملف،
+# حد الطلبات، وإعدادات التحميل لكل منصة.
+#   - القيم الافتراضية من config.py، والملف يستبدل المفاتيح التي يحددها فقط
+#   - عند تعديل الملف: قراءة + تحقق + تجهيز الجداول في thread منفصل،
+#     ثم استبدال اللقطة كاملة بمرجع واحد (الطلبات الجارية لا تتوقف)
+#   - ملف غير صالح: تبقى الإعدادات السابقة ويُطبع سبب الرفض
+
+import os
+import re
+import json
+import time
+import asyncio
+from urllib.parse import urlparse
+from config import (
+    SETTINGS_FILE, ADS_ENABLED, ADS_LIST, MAX_ADS_PER_USER_DAILY, SUPPORTED_PLATFORMS,
+    MAX_FILE_SIZE_MB, RATE_LIMIT_SECONDS, PLATFORM_DOWNLOAD_PROFILES
+)
+
+DEFAULTS = {
+    "ads_enabled": ADS_ENABLED,
+    "ads": ADS_LIST,
+    "max_ads_per_user_daily": MAX_ADS_PER_USER_DAILY,
+    "supported_platforms": SUPPORTED_PLATFORMS,
+    "max_file_size_mb": MAX_FILE_SIZE_MB,
+    "rate_limit_seconds": RATE_LIMIT_SECONDS,
+    "platform_download_profiles": PLATFORM_DOWNLOAD_PROFILES,
+}
+
+AD_REQUIRED_FIELDS = ("id", "text", "button_text", "button_url")
+PROFILE_FIELDS = {"concurrent_fragments", "http_chunk_size", "external_downloader", "external_downloader_args"}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate(data: dict) -> dict:
+    """
+    التحقق من الملف ودمجه مع القيم الافتراضية
+    Raises: ValueError مع كل الأخطاء (سطر لكل خطأ)
+    """
+    if not isinstance(data, dict):
+        raise ValueError("settings must be a JSON object")
+    errors = [f"unknown key: {key}" for key in data if key not in DEFAULTS]
+    values = {**DEFAULTS, **data}
+
+    if not isinstance(values["ads_enabled"], bool):
+        errors.append("ads_enabled must be true or false")
+
+    ads = values["ads"]
+    if not isinstance(ads, list):
+        errors.append("ads must be a list")
+    else:
+        ids = set()
+        for i, ad in enumerate(ads):
+            if not isinstance(ad, dict):
+                errors.append(f"ads[{i}] must be an object")
+                continue
+            missing = [field for field in AD_REQUIRED_FIELDS if not ad.get(field)]
+            if missing:
+                errors.append(f"ads[{i}] missing {', '.join(missing)}")
+            if not str(ad.get("button_url", "")).startswith(("http://", "https://", "tg://")):
+                errors.append(f"ads[{i}].button_url must be a link")
+            if "priority" in ad and not _is_number(ad["priority"]):
+                errors.append(f"ads[{i}].priority must be a number")
+            if ad.get("id") in ids:
+                errors.append(f"ads[{i}] duplicate id {ad.get('id')}")
+            ids.add(ad.get("id"))
+
+    limit = values["max_ads_per_user_daily"]
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 0:
+        errors.append("max_ads_per_user_daily must be an integer >= 0")
+
+    platforms = values["supported_platforms"]
+    if not isinstance(platforms, list) or not platforms or not all(isinstance(p, str) and p for p in platforms):
+        errors.append("supported_platforms must be a non-empty list of domains")
+
+    size = values["max_file_size_mb"]
+    if not _is_number(size) or not 1 <= size <= 2000:
+        errors.append("max_file_size_mb must be between 1 and 2000")
+
+    if not _is_number(values["rate_limit_seconds"]) or values["rate_limit_seconds"] < 0:
+        errors.append("rate_limit_seconds must be a number >= 0")
+
+    profiles = values["platform_download_profiles"]
+    if not isinstance(profiles, dict) or "default" not in profiles:
+        errors.append("platform_download_profiles must be an object with a 'default' entry")
+    else:
+        for platform, profile in profiles.items():
+            if not isinstance(profile, dict) or set(profile) - PROFILE_FIELDS:
+                errors.append(f"platform_download_profiles.{platform}: only {sorted(PROFILE_FIELDS)} are allowed")
+                continue
+            fragments = profile.get("concurrent_fragments", 1)
+            if not isinstance(fragments, int) or isinstance(fragments, bool) or not 1 <= fragments <= 32:
+                errors.append(f"platform_download_profiles.{platform}.concurrent_fragments must be 1-32")
+            chunk = profile.get("http_chunk_size")
+            if chunk is not None and (not isinstance(chunk, int) or chunk <= 0):
+                errors.append(f"platform_download_profiles.{platform}.http_chunk_size must be a positive integer or null")
+            tool = profile.get("external_downloader")
+            if tool is not None and (not isinstance(tool, str) or not tool):
+                errors.append(f"platform_download_profiles.{platform}.external_downloader must be a program name or null")
+            args = profile.get("external_downloader_args", [])
+            if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+                errors.append(f"platform_download_profiles.{platform}.external_downloader_args must be a list of strings")
+
+    if errors:
+        raise ValueError("\n".join(errors))
+    return values
+
+
+class Settings:
+    """لقطة ثابتة من الإعدادات مع الجداول المجهزة مسبقاً"""
+
+    def __init__(self, values: dict, source: str = "config.py"):
+        self.values = values
+        self.source = source
+        self.loaded_at = time.time()
+        self.ads_enabled = values["ads_enabled"]
+        self.max_ads_per_user_daily = values["max_ads_per_user_daily"]
+        self.max_file_size_mb = values["max_file_size_mb"]
+        self.rate_limit_seconds = values["rate_limit_seconds"]
+        self.supported_platforms = tuple(p.lower().strip(".") for p in values["supported_platforms"])
+
+        # جداول اختيار الإعلانات
+        self.active_ads = tuple(ad for ad in values["ads"] if ad.get("active", True))
+        by_priority = sorted(self.active_ads, key=lambda ad: ad.get("priority", 999))
+        self.top_ads = tuple(by_priority[:2])
+        self.ad_positions = {ad["id"]: i for i, ad in enumerate(self.active_ads)}
+
+        # الدومين أو أي subdomain منه (www. و m. و vm. ...)
+        self._domain_pattern = re.compile(
+            r"(?:^|\.)(?:" + "|".join(re.escape(p) for p in self.supported_platforms) + r")$"
+        )
+
+        # إعدادات كل منصة مدمجة مع default
+        profiles = values["platform_download_profiles"]
+        default = profiles["default"]
+        self.download_profiles = {platform: {**default, **profile} for platform, profile in profiles.items()}
+
+    def is_supported(self, url: str) -> bool:
+        """هل الرابط من منصة مدعومة"""
+        url = url.strip()
+        if "://" not in url:
+            url = "//" + url
+        try:
+            host = urlparse(url).hostname or ""
+        except ValueError:
+            return False
+        return bool(self._domain_pattern.search(host))
+
+    def download_profile(self, platform: str) -> dict:
+        return self.download_profiles.get(platform, self.download_profiles["default"])
+
+
+class SettingsStore:
+    def __init__(self, path: str = SETTINGS_FILE):
+        self.path = path
+        self.current = Settings(validate({}))
+        self.last_error = None
+        self.reloads = 0
+        self._stamp = None
+        self.reload()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def _build(self, stamp):
+        """قراءة الملف والتحقق منه وتجهيز الجداول (يعمل داخل thread)"""
+        if stamp is None:
+            return Settings(validate({}))
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return Settings(validate(data), source=self.path)
+
+    def _swap(self, stamp, built=None, error=None) -> bool:
+        self._stamp = stamp
+        if error is not None:
+            self.last_error = str(error)
+            print(f"Error loading {self.path} (keeping previous settings):\n{error}")
+            return False
+        self.current = built
+        self.last_error = None
+        self.reloads += 1
+        return True
+
+    def reload(self) -> bool:
+        """تحميل فوري (عند البدء أو من /reload)"""
+        stamp = self._file_stamp()
+        try:
+            built = self._build(stamp)
+        except (OSError, ValueError) as e:
+            return self._swap(stamp, error=e)
+        return self._swap(stamp, built)
+
+    def update(self, overrides: dict) -> bool:
+        """تعديل قيم من الكود (مثلاً اختبار الحمل) مع نفس التحقق"""
+        try:
+            built = Settings(validate({**self.current.values, **overrides}), source="override")
+        except ValueError as e:
+            return self._swap(self._stamp, error=e)
+        return self._swap(self._stamp, built)
+
+    async def watch(self, interval: float):
+        """مراقبة الملف وإعادة تحميله عند أي تغيير"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                continue
+            try:
+                built = await loop.run_in_executor(None, self._build, stamp)
+            except (OSError, ValueError) as e:
+                self._swap(stamp, error=e)
+                continue
+            if self._swap(stamp, built):
+                print(f"Settings reloaded from {built.source}")
+
+    def status(self) -> dict:
+        current = self.current
+        return {
+            "source": current.source,
+            "loaded_at": current.loaded_at,
+            "reloads": self.reloads,
+            "ads": len(current.active_ads),
+            "platforms": len(current.supported_platforms),
+            "error": self.last_error,
+        }
+
+
+settings = SettingsStore()
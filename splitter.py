@@ -0,0 +1,139 @@
+# ✂️ تقسيم الفيديوهات الكبيرة إلى أجزاء
+# ================================
+
+import os
+import math
+import shutil
+import asyncio
+from config import MAX_SPLIT_PARTS, SPLIT_SIZE_MARGIN
+
+
+class VideoSplitter:
+    def __init__(self):
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.ffprobe = shutil.which("ffprobe")
+
+    @property
+    def available(self) -> bool:
+        """هل ffmpeg و ffprobe متوفران"""
+        return bool(self.ffmpeg and self.ffprobe)
+
+    def estimate_parts(self, file_path: str, max_bytes: int) -> int:
+        """تقدير عدد الأجزاء اللازمة"""
+        target = max_bytes * SPLIT_SIZE_MARGIN
+        return max(1, math.ceil(os.path.getsize(file_path) / target))
+
+    def can_split(self, file_path: str, max_bytes: int) -> bool:
+        """التحقق من إمكانية التقسيم ضمن الحد الأقصى للأجزاء"""
+        if not self.available or not os.path.exists(file_path):
+            return False
+        return self.estimate_parts(file_path, max_bytes) <= MAX_SPLIT_PARTS
+
+    async def probe_duration(self, file_path: str) -> float:
+        """قراءة مدة الفيديو بالثواني عبر ffprobe"""
+        proc = await asyncio.create_subprocess_exec(
+            self.ffprobe, "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            file_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await proc.communicate()
+        try:
+            return float(stdout.decode().strip())
+        except ValueError:
+            return 0.0
+
+    async def _cut(self, src: str, dst: str, start: float, length: float) -> bool:
+        """قص جزء بدون إعادة ترميز (يبدأ من أقرب keyframe)"""
+        proc = await asyncio.create_subprocess_exec(
+            self.ffmpeg, "-y", "-v", "error",
+            "-ss", f"{start:.3f}", "-i", src,
+            "-t", f"{length:.3f}",
+            "-map", "0", "-c", "copy",
+            "-avoid_negative_ts", "make_zero",
+            "-movflags", "+faststart",
+            dst,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        await proc.wait()
+        if proc.returncode == 0 and os.path.exists(dst):
+            return True
+        # ffmpeg -y يترك ملفاً ناقصاً عند الفشل
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+    async def _produce(self, file_path: str, max_bytes: int, queue: asyncio.Queue):
+        """قص الأجزاء بالترتيب ووضعها في الطابور"""
+        try:
+            duration = await self.probe_duration(file_path)
+            if duration <= 0:
+                raise RuntimeError("تعذر قراءة مدة الفيديو")
+
+            size = os.path.getsize(file_path)
+            base, ext = os.path.splitext(file_path)
+            nominal = duration * (max_bytes * SPLIT_SIZE_MARGIN) / size
+
+            start = 0.0
+            index = 0
+            while start < duration - 0.5:
+                index += 1
+                if index > MAX_SPLIT_PARTS:
+                    raise RuntimeError("عدد الأجزاء أكبر من الحد المسموح")
+
+                dst = f"{base}.part{index:02d}{ext}"
+                length = nominal
+                # إذا تجاوز الجزء الحد نعيد القص بمدة أقصر
+                for _ in range(3):
+                    if not await self._cut(file_path, dst, start, length):
+                        raise RuntimeError("فشل ffmpeg في قص الجزء")
+                    if os.path.getsize(dst) <= max_bytes:
+                        break
+                    length *= 0.8
+                else:
+                    os.remove(dst)
+                    raise RuntimeError("تعذر إنتاج جزء ضمن الحد الأقصى")
+
+                await queue.put({
+                    "index": index,
+                    "path": dst,
+                    "duration": int(min(length, duration - start)),
+                })
+                # التقدم بالمدة الاسمية: القص يبدأ من keyframe سابق فلا توجد فجوات
+                start += length
+
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    async def stream_parts(self, file_path: str, max_bytes: int, prefetch: int = 1):
+        """
+        توليد الأجزاء بشكل متسلسل (pipeline)
+        الجزء التالي يُقص بينما يتم رفع الجزء الحالي
+        """
+        queue = asyncio.Queue(maxsize=max(1, prefetch))
+        producer = asyncio.create_task(self._produce(file_path, max_bytes, queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if not producer.done():
+                producer.cancel()
+            # حذف أي أجزاء لم يتم استهلاكها
+            while not queue.empty():
+                item = queue.get_nowait()
+                if isinstance(item, dict):
+                    try:
+                        os.remove(item["path"])
+                    except OSError:
+                        pass